@@ -0,0 +1,214 @@
+''' A local stand-in for the spacetime cache server, for measuring the crawler
+without network access. It answers the same requests as the real cache
+(GET /?q=<url>&u=<user agent>) with cbor-encoded Response payloads, serving
+pages from a synthetic or recorded web graph with configurable latency and
+error rate.
+
+Run it on its own with
+    python -m benchmark.mock_cache_server --port 9000
+and point the crawler at it, or start it from code (see benchmark/run.py). '''
+
+import itertools
+import json
+import pickle
+import random
+import time
+import zlib
+
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class SyntheticGraph(object):
+    ''' A deterministic web graph of pages_per_host pages on each of hosts
+        ics.uci.edu subdomains. Each page links to links_per_page other
+        pages, mostly on its own host, and has words_per_page words drawn
+        from a vocabulary with a Zipf-like distribution. Each page ranks the
+        vocabulary from its own starting word, so pages don't share their
+        most frequent words and aren't near-duplicates of each other. '''
+    def __init__(self, hosts=16, pages_per_host=200, links_per_page=20,
+                 words_per_page=500, vocabulary=20000, local_links=0.8, seed=0):
+        self.hosts = [f"h{i}.ics.uci.edu" for i in range(hosts)]
+        self.pages_per_host = pages_per_host
+        self.links_per_page = links_per_page
+        self.words_per_page = words_per_page
+        self.local_links = local_links
+        self.seed = seed
+        self.words = [f"word{i}" for i in range(vocabulary)]
+        self.cum_weights = list(itertools.accumulate(
+            1 / (rank + 1) for rank in range(vocabulary)))
+
+    def seeds(self):
+        return [f"https://{host}/page0.html" for host in self.hosts]
+
+    def page(self, url):
+        ''' Returns (status, content type, body) for url. '''
+        parsed = urlparse(url)
+        path = parsed.path
+        if (parsed.hostname not in self.hosts or not path.startswith("/page")
+                or not path.endswith(".html")
+                or not path[5:-5].isdigit()
+                or int(path[5:-5]) >= self.pages_per_host):
+            return 404, "text/html", b"<html><body>Not found</body></html>"
+        rnd = random.Random(zlib.crc32(url.encode("utf-8")) ^ self.seed)
+        links = []
+        for _ in range(self.links_per_page):
+            if rnd.random() < self.local_links:
+                host = parsed.hostname
+            else:
+                host = rnd.choice(self.hosts)
+            page = rnd.randrange(self.pages_per_host)
+            links.append(f'<a href="https://{host}/page{page}.html">page {page}</a>')
+        start = rnd.randrange(len(self.words))
+        words = " ".join(
+            self.words[(start + rank) % len(self.words)]
+            for rank in rnd.choices(
+                range(len(self.words)), cum_weights=self.cum_weights,
+                k=self.words_per_page))
+        body = (
+            f"<html><head><title>{url}</title></head><body>"
+            f"<p>{words}</p><div>{' '.join(links)}</div></body></html>")
+        return 200, "text/html", body.encode("utf-8")
+
+
+class RecordedGraph(object):
+    ''' A web graph recorded to a json lines file, one page per line:
+        {"url": ..., "status": 200, "content_type": "text/html", "body": ...}.
+        The first recorded url is the seed. '''
+    def __init__(self, path):
+        self.pages = dict()
+        with open(path) as recording:
+            for line in recording:
+                page = json.loads(line)
+                self.pages[page["url"]] = (
+                    page.get("status", 200),
+                    page.get("content_type", "text/html"),
+                    page["body"].encode("utf-8"))
+
+    def seeds(self):
+        return list(self.pages)[:1]
+
+    def page(self, url):
+        return self.pages.get(
+            url, (404, "text/html", b"<html><body>Not found</body></html>"))
+
+
+class MockCacheServer(object):
+    ''' Serves a web graph the way the cache server does. Every request
+        waits latency seconds plus up to jitter more, and fails with
+        probability error_rate: half of the failures as a 500 from the page,
+        half as a 601 from the cache server failing to download it, with no
+        response. '''
+    def __init__(self, graph, latency=0.0, jitter=0.0, error_rate=0.0,
+                 host="127.0.0.1", port=0, seed=0):
+        self.graph = graph
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.server = ThreadingHTTPServer((host, port), _CacheHandler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.address
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def payload(self, url):
+        ''' The cbor-encoded Response payload for url. '''
+        time.sleep(self.latency + self.random.random() * self.jitter)
+        if self.random.random() < self.error_rate:
+            if self.random.random() < 0.5:
+                return cbor.dumps({
+                    "url": url, "status": 601,
+                    "error": f"Mock cache error for {url}."})
+            status, content_type, body = 500, "text/html", b"Server error"
+        else:
+            status, content_type, body = self.graph.page(url)
+        return encode_page(url, status, content_type, body)
+
+
+def encode_page(url, status, content_type, body):
+    ''' The cache server's payload for a page: cbor holding the pickled
+        requests.Response. '''
+    resp = requests.Response()
+    resp.url = url
+    resp.status_code = status
+    resp.reason = "OK" if status == 200 else "Error"
+    resp.headers = CaseInsensitiveDict({
+        "Content-Type": content_type, "Content-Length": str(len(body))})
+    resp._content = body
+    resp.encoding = "utf-8"
+    return cbor.dumps({
+        "url": url, "status": status, "response": pickle.dumps(resp)})
+
+
+class _CacheHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; don't let Nagle's algorithm
+    # hold the body back for the client's delayed ack.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        url = query.get("q", [""])[0]
+        body = self.server.mock.payload(url)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/cbor")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def add_graph_arguments(parser):
+    parser.add_argument("--recording", type=str, default=None,
+                        help="json lines web graph to serve instead of a synthetic one")
+    parser.add_argument("--hosts", type=int, default=16)
+    parser.add_argument("--pages_per_host", type=int, default=200)
+    parser.add_argument("--links_per_page", type=int, default=20)
+    parser.add_argument("--words_per_page", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+
+
+def make_graph(args):
+    if args.recording:
+        return RecordedGraph(args.recording)
+    return SyntheticGraph(
+        args.hosts, args.pages_per_host, args.links_per_page,
+        args.words_per_page)
+
+
+def make_server(args, port=0):
+    return MockCacheServer(
+        make_graph(args), args.latency, args.jitter, args.error_rate, port=port)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--port", type=int, default=9000)
+    add_graph_arguments(parser)
+    args = parser.parse_args()
+    server = make_server(args, args.port)
+    host, port = server.address
+    print(f"Mock cache server on {host}:{port}, seeds: "
+          f"{','.join(server.graph.seeds())}")
+    server.server.serve_forever()
@@ -0,0 +1,252 @@
+''' Offline crawler benchmarks, run against the mock cache server so they need
+no network access:
+
+    python -m benchmark.run --threads 1,4,16
+
+crawls the mock web graph once per THREADCOUNT value and reports pages/s,
+p50/p99 download latency and peak RSS, then times is_valid,
+extract_next_links, count_words and Frontier.add_url. Each run is a separate
+process working in its own temporary directory, so runs don't share caches,
+metrics or save files and peak RSS is per run. Peak RSS is reported for the
+run's own process and for the largest of its child processes (shards and
+parse processes), which hold most of the crawl when there are any. '''
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from benchmark.mock_cache_server import (
+    add_graph_arguments, make_graph, make_server, encode_page)
+
+
+def load_config(options, threads):
+    from utils.config import Config
+    cparser = ConfigParser()
+    cparser.read(options["config_file"])
+    config = Config(cparser)
+    config.threads_count = threads
+    config.save_file = "frontier.log"
+    config.time_delay = options["politeness"]
+    config.stats_interval = 0
+    if options["engine"]:
+        config.engine = options["engine"]
+    if options["frontier"]:
+        config.frontier = options["frontier"]
+    if options["parser"]:
+        config.parser = options["parser"]
+    if options["shards"]:
+        config.shards = options["shards"]
+    return config
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    ''' Peak RSS of this process, or with RUSAGE_CHILDREN of the largest of
+        its child processes that have exited. '''
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def crawl(options):
+    ''' Crawls the mock graph served at options["cache_server"] and returns
+        the run's results. '''
+    from crawler import Crawler
+    from crawler.async_crawler import AsyncCrawler
+    from crawler.frontier import FRONTIERS
+    from crawler.sharded import ShardedCrawler
+    from utils.metrics import metrics
+
+    config = load_config(options, options["threads"])
+    config.cache_server = tuple(options["cache_server"])
+    config.seed_urls = make_graph(_Args(options)).seeds()
+    if config.shards > 1:
+        crawler_factory = ShardedCrawler
+    elif config.engine == "async":
+        crawler_factory = AsyncCrawler
+    else:
+        crawler_factory = Crawler
+    crawler = crawler_factory(
+        config, True, frontier_factory=FRONTIERS[config.frontier])
+    start = time.perf_counter()
+    crawler.start()
+    seconds = time.perf_counter() - start
+    snapshot = metrics.snapshot()
+    download = snapshot["histograms"].get("download", {})
+    pages = snapshot["counters"].get("pages", 0)
+    return {
+        "engine": config.engine,
+        "threads": config.threads_count,
+        "pages": pages,
+        "seconds": seconds,
+        "pages_per_second": pages / seconds if seconds else 0.0,
+        "p50": download.get("p50", 0.0),
+        "p99": download.get("p99", 0.0),
+        "peak_rss_mb": peak_rss_mb(),
+        "child_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN)}
+
+
+def best_rate(function, items, repeat=3, setup=None):
+    ''' Calls function on every item, repeat times, and returns the best
+        rate in calls per second. setup runs before each repeat. '''
+    best = 0.0
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        seconds = time.perf_counter() - start
+        best = max(best, len(items) / seconds if seconds else 0.0)
+    return best
+
+
+def micro(options):
+    ''' Times the crawler's hot functions on pages from the mock graph and
+        returns {name: calls per second}. '''
+    import scraper
+    from crawler.frontier import FRONTIERS
+    from crawler.store import STORES
+    from utils import get_urlhash
+    from utils.download import to_response
+    from utils.urls import parse_url
+
+    graph = make_graph(_Args(options))
+    seeds = graph.seeds()
+    payloads = [encode_page(url, *graph.page(url))
+                for url in seeds[:options["micro_pages"]]]
+    pages = [to_response(url, 200, payload)
+             for url, payload in zip(seeds, payloads)]
+    if len(pages) < options["micro_pages"]:
+        # Follow links from the seeds until there are enough pages.
+        for link in scraper.scraper(seeds[0], pages[0]):
+            pages.append(to_response(link, 200, encode_page(link, *graph.page(link))))
+            if len(pages) >= options["micro_pages"]:
+                break
+    urls = list(dict.fromkeys(
+        link for resp in pages
+        for link in scraper.extract_next_links(resp.url, resp)))
+    texts = [resp.raw_response.content.decode("utf-8") for resp in pages]
+
+    def clear_url_caches():
+        scraper.is_valid.cache_clear()
+        parse_url.cache_clear()
+        get_urlhash.cache_clear()
+
+    results = dict()
+    results["to_response"] = best_rate(
+        lambda payload: to_response("", 200, payload).raw_response, payloads)
+    results["is_valid"] = best_rate(
+        scraper.is_valid, urls, setup=clear_url_caches)
+    results["is_valid (cached)"] = best_rate(scraper.is_valid, urls)
+    for extractor in ("bs4", "fast"):
+        results[f"extract_next_links ({extractor})"] = best_rate(
+            lambda resp: scraper.extract_next_links(resp.url, resp, extractor),
+            pages)
+    results["count_words"] = best_rate(scraper.count_words, texts)
+    for store in STORES:
+        config = load_config(options, 1)
+        config.store = store
+        config.save_file = f"frontier-{store}.save"
+        frontier = FRONTIERS[config.frontier](config, True)
+        # A fresh url on every repeat, so each add goes to the save file.
+        fresh = iter(range(1 << 62))
+        results[f"Frontier.add_url ({store})"] = best_rate(
+            lambda url: frontier.add_url(f"{url}?v={next(fresh)}"), urls)
+        if hasattr(frontier, "close"):
+            frontier.close()
+    return results
+
+
+class _Args(object):
+    ''' Options dict as the argparse namespace make_graph expects. '''
+    def __init__(self, options):
+        self.__dict__.update(options)
+
+
+def run_child(options):
+    ''' Runs one benchmark in a fresh process in a temporary directory and
+        returns its results. '''
+    with tempfile.TemporaryDirectory(prefix="crawler-bench-") as workdir:
+        env = dict(os.environ, PYTHONPATH=REPO)
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmark.run", "--child", json.dumps(options)],
+            cwd=workdir, env=env, check=True, stdout=subprocess.PIPE,
+            stderr=None if options["verbose"] else subprocess.DEVNULL,
+            universal_newlines=True).stdout
+    # Config prints the user agent first; the results are the last line.
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(args):
+    options = dict(vars(args))
+    options["config_file"] = os.path.abspath(args.config_file)
+    if args.recording:
+        options["recording"] = os.path.abspath(args.recording)
+    lines = list()
+    if not args.skip_crawl:
+        server = make_server(args)
+        options["cache_server"] = server.start()
+        lines.append(
+            f"{'engine':<8}{'threads':>8}{'pages':>8}{'seconds':>9}"
+            f"{'pages/s':>9}{'p50 ms':>8}{'p99 ms':>8}{'rss MB':>8}"
+            f"{'child MB':>9}")
+        print(lines[-1])
+        for threads in args.threads:
+            result = run_child(dict(options, mode="crawl", threads=threads))
+            lines.append(
+                f"{result['engine']:<8}{result['threads']:>8}{result['pages']:>8}"
+                f"{result['seconds']:>9.2f}{result['pages_per_second']:>9.1f}"
+                f"{result['p50'] * 1000:>8.1f}{result['p99'] * 1000:>8.1f}"
+                f"{result['peak_rss_mb']:>8.1f}{result['child_rss_mb']:>9.1f}")
+            print(lines[-1])
+        server.stop()
+    if not args.skip_micro:
+        lines.append(f"{'function':<36}{'calls/s':>12}")
+        print(lines[-1])
+        for name, rate in run_child(dict(options, mode="micro")).items():
+            lines.append(f"{name:<36}{rate:>12.0f}")
+            print(lines[-1])
+    if args.output:
+        with open(args.output, "a") as output:
+            output.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str,
+                        default=os.path.join(REPO, "config.ini"))
+    parser.add_argument("--threads", type=lambda value: [
+                        int(threads) for threads in value.split(",")],
+                        default=[1, 4, 16], help="comma separated THREADCOUNT values")
+    parser.add_argument("--engine", choices=["threads", "async"], default=None)
+    parser.add_argument("--frontier", choices=["basic", "polite"], default=None)
+    parser.add_argument("--parser", choices=["inline", "process"], default=None)
+    parser.add_argument("--shards", type=int, default=None,
+                        help="SHARDS crawler processes, each with the given threads")
+    parser.add_argument("--politeness", type=float, default=0.0,
+                        help="POLITENESS delay in seconds for the crawl")
+    parser.add_argument("--micro_pages", type=int, default=50)
+    parser.add_argument("--skip_crawl", action="store_true", default=False)
+    parser.add_argument("--skip_micro", action="store_true", default=False)
+    parser.add_argument("--output", type=str, default=None,
+                        help="file to append the results to")
+    parser.add_argument("--verbose", action="store_true", default=False)
+    # Options of a single run, set when main starts it in a child process.
+    parser.add_argument("--child", type=json.loads, default=None)
+    add_graph_arguments(parser)
+    args = parser.parse_args()
+    if args.child:
+        run = crawl if args.child["mode"] == "crawl" else micro
+        print(json.dumps(run(args.child)))
+    else:
+        main(args)
@@ -1,16 +1,25 @@
 from utils import get_logger
+from utils.metrics import StatsReporter
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+from crawler.parse_pool import close_pool
+import scraper
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
         self.logger = get_logger("CRAWLER")
         self.frontier = frontier_factory(config, restart)
+        scraper.open_fingerprints(
+            config, getattr(self.frontier, "from_seeds", restart))
         self.workers = list()
         self.worker_factory = worker_factory
+        self.stats = StatsReporter(
+            self.logger, config.stats_port, config.stats_interval,
+            config.stats_file)
 
     def start_async(self):
+        self.stats.start()
         self.workers = [
             self.worker_factory(worker_id, self.config, self.frontier)
             for worker_id in range(self.config.threads_count)]
@@ -24,3 +33,7 @@ class Crawler(object):
     def join(self):
         for worker in self.workers:
             worker.join()
+        if hasattr(self.frontier, "close"):
+            self.frontier.close()
+        close_pool()
+        self.stats.stop()
@@ -0,0 +1,128 @@
+import asyncio
+import math
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from utils import get_logger
+from utils.metrics import metrics, StatsReporter
+from utils.download import to_response
+from utils.response import Response
+from crawler.frontier import PoliteFrontier
+from crawler.parse_pool import get_scraper, close_pool
+from crawler.worker import crawl_page
+import scraper
+
+
+class AsyncCrawler(object):
+    ''' Crawler that keeps up to config.max_in_flight downloads going from a
+        single asyncio event loop instead of one thread per download. Pages
+        are decoded and scraped on a pool of config.threads_count threads,
+        and use the same frontier and scraper as the threaded Crawler.
+
+        The frontier must provide poll_tbd_url (see PoliteFrontier), since
+        the event loop cannot block in get_tbd_url. Requires aiohttp. '''
+    def __init__(self, config, restart, frontier_factory=PoliteFrontier):
+        self.config = config
+        self.logger = get_logger("CRAWLER")
+        self.frontier = frontier_factory(config, restart)
+        scraper.open_fingerprints(
+            config, getattr(self.frontier, "from_seeds", restart))
+        if not hasattr(self.frontier, "poll_tbd_url"):
+            raise TypeError(
+                f"{type(self.frontier).__name__} does not support "
+                f"poll_tbd_url, which the async engine needs.")
+        host, port = config.cache_server
+        self.cache_url = f"http://{host}:{port}/"
+        self.scraper = get_scraper(config)
+
+    def start(self):
+        stats = StatsReporter(
+            self.logger, self.config.stats_port, self.config.stats_interval,
+            self.config.stats_file)
+        stats.start()
+        asyncio.run(self._crawl())
+        self.frontier.close()
+        close_pool()
+        stats.stop()
+
+    async def _crawl(self):
+        import aiohttp
+        self.page_done = asyncio.Event()
+        in_flight = set()
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.config.connect_timeout,
+            sock_read=self.config.read_timeout)
+        connector = aiohttp.TCPConnector(limit=self.config.max_in_flight)
+        with ThreadPoolExecutor(self.config.threads_count) as executor:
+            async with aiohttp.ClientSession(
+                    connector=connector, timeout=timeout) as session:
+                while True:
+                    if len(in_flight) >= self.config.max_in_flight:
+                        await asyncio.wait(
+                            in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    # Cleared before polling, so a page finishing after the
+                    # poll still wakes us up.
+                    self.page_done.clear()
+                    url, wait = self.frontier.poll_tbd_url()
+                    if url is not None:
+                        task = asyncio.create_task(
+                            self._crawl_url(session, executor, url))
+                        in_flight.add(task)
+                        task.add_done_callback(in_flight.discard)
+                    elif wait is None:
+                        self.logger.info("Frontier is empty. Stopping Crawler.")
+                        break
+                    else:
+                        try:
+                            await asyncio.wait_for(
+                                self.page_done.wait(),
+                                None if wait == math.inf else wait)
+                        except asyncio.TimeoutError:
+                            pass
+
+    async def _crawl_url(self, session, executor, url):
+        import aiohttp
+        # Set once crawl_page has the url, which always completes it.
+        handed_off = False
+        try:
+            start = time.perf_counter()
+            try:
+                async with session.get(
+                        self.cache_url,
+                        params=[("q", f"{url}"), ("u", f"{self.config.user_agent}")]
+                        ) as resp:
+                    status, content = resp.status, await resp.read()
+            except asyncio.TimeoutError:
+                status, content = 408, None
+            except aiohttp.ClientError as e:
+                self.logger.error(f"Request error {e} with url {url}.")
+                status, content = 503, None
+            latency = time.perf_counter() - start
+            metrics.histogram("download").record(latency)
+            future = executor.submit(
+                crawl_page, self.frontier, self.scraper, url,
+                partial(self._response, url, status, content, latency),
+                self.logger, self.config)
+            handed_off = True
+            await asyncio.wrap_future(future)
+        except Exception:
+            self.logger.exception(f"Failed to crawl {url}.")
+            if not handed_off:
+                # Released anyway, or the host would stay busy forever.
+                self.frontier.mark_url_complete(url)
+        finally:
+            self.page_done.set()
+
+    def _response(self, url, status, content, latency):
+        ''' Decodes the cache server's reply for crawl_page, on the
+            executor. '''
+        if content is None:
+            error = f"Request error <{status}> with url {url}."
+            resp = Response(
+                {"error": error, "status": status, "url": url},
+                transport_error=True)
+        else:
+            resp = to_response(url, status, content, self.logger)
+        return resp, latency
@@ -0,0 +1,73 @@
+import os
+import math
+import mmap
+import struct
+
+
+class BloomFilter(object):
+    ''' Bloom filter over url hashes (hex sha256 digests), kept in a memory
+        mapped file so it survives restarts without being rebuilt. Sized for
+        capacity items at the given false positive rate.
+
+        If the file is missing, or was made for a different size, a new empty
+        filter is created and created is set, so the caller can fill it from
+        the save file. Bits are set in the mapping as soon as a hash is added,
+        so the file stays complete even if the crawler process dies; only an
+        operating system crash can lose bits that were not flushed. '''
+    MAGIC = b"URLBLOOM"
+    HEADER = struct.Struct("<8sQQ")
+
+    def __init__(self, path, capacity, error_rate):
+        self.path = path
+        self.size = max(8, int(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        length = self.HEADER.size + (self.size + 7) // 8
+        self.created = not self._matches(length)
+        if self.created:
+            with open(path, "wb") as bloom:
+                bloom.write(self.HEADER.pack(self.MAGIC, self.size, self.hashes))
+                bloom.truncate(length)
+        self.file = open(path, "r+b")
+        self.bits = mmap.mmap(self.file.fileno(), length)
+
+    def _matches(self, length):
+        ''' Whether path holds a filter with this size and number of hashes. '''
+        if not os.path.exists(self.path) or os.path.getsize(self.path) != length:
+            return False
+        with open(self.path, "rb") as bloom:
+            header = bloom.read(self.HEADER.size)
+        return header == self.HEADER.pack(self.MAGIC, self.size, self.hashes)
+
+    @staticmethod
+    def remove(path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _positions(self, urlhash):
+        # Double hashing on two 64 bit halves of the digest.
+        h1 = int(urlhash[:16], 16)
+        h2 = int(urlhash[16:32], 16) | 1
+        offset = self.HEADER.size * 8
+        for i in range(self.hashes):
+            yield offset + (h1 + i * h2) % self.size
+
+    def add(self, urlhash):
+        bits = self.bits
+        for position in self._positions(urlhash):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, urlhash):
+        bits = self.bits
+        for position in self._positions(urlhash):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def flush(self):
+        self.bits.flush()
+
+    def close(self):
+        self.bits.flush()
+        self.bits.close()
+        self.file.close()
@@ -1,72 +1,375 @@
-import os
-import shelve
+import math
+import time
+import heapq
+import itertools
 
-from threading import Thread, RLock
+from threading import Thread, RLock, Condition
 from queue import Queue, Empty
 
 from utils import get_logger, get_urlhash, normalize
+from utils.urls import parse_url
+from utils.metrics import metrics
+from utils.digests import DigestMap, short_digest
 from scraper import is_valid
+from crawler.store import STORES, ShelveStore, is_shelve
+from crawler.bloom import BloomFilter
+from crawler.priority import SCORERS
+from crawler.hostrate import RateControl
+from crawler.urlqueue import HostQueue, MASK32
 
 class Frontier(object):
+    # Workers sleep for config.time_delay after every page unless the
+    # frontier itself spaces out requests to the same host.
+    polite = False
+    # Urls are loaded from the save file this many at a time, and pollers
+    # check back this many seconds later while they are.
+    LOAD_BATCH = 1000
+    LOAD_WAIT = 0.05
+
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
+        # A Condition so subclasses can also wait on the frontier lock.
+        self.lock = Condition(RLock())
+        self.score = SCORERS[self.config.priority]
+        # host id -> HostQueue of the urls waiting to be downloaded from it;
+        # a host is only here while it has queued urls.
+        self.queues = dict()
+        # netloc -> host id, and host id -> number of its urls queued so far.
+        self.host_ids = dict()
+        self.host_counts = list()
+        # Heap of (key of best url) << 32 | host id for the hosts that may be
+        # downloaded from, and host id -> that key for the live entries.
+        self.eligible = list()
+        self.eligible_keys = dict()
+        # url digest -> host id << 32 | slot for every queued url. Digests
+        # are 64 bits; a collision could only misdirect a rescore.
+        self.pending = DigestMap()
+        # url -> depth of the urls out with a worker, for their links' depth.
+        self.in_flight = dict()
+        self.queued_count = itertools.count()
+        # Set while the save file is being loaded in the background.
+        self.loading = False
+        self.loader = None
         
-        if not os.path.exists(self.config.save_file) and not restart:
+        store = STORES[self.config.store]
+        if store is not ShelveStore and is_shelve(self.config.save_file):
+            # Written before the log store was the default: resumed as it is,
+            # or deleted as a shelve on a restart.
+            if not restart:
+                self.logger.warning(
+                    f"{self.config.save_file} is a shelve save file, resuming "
+                    f"it with the shelve store instead of {self.config.store}. "
+                    f"Use --restart to start over with the "
+                    f"{self.config.store} store.")
+            store = ShelveStore
+        if not store.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
                 f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
+        elif store.exists(self.config.save_file) and restart:
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            store.remove(self.config.save_file)
+            store = STORES[self.config.store]
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
-        if restart:
+        self.save = store(self.config.save_file, self.config)
+        # Whether the crawl starts over from the seeds, so state saved next
+        # to the save file (like the bloom filter) must be cleared.
+        self.from_seeds = restart or not self.save
+        # Bloom filter of seen url hashes, so most new urls never need to be
+        # looked up in the save file.
+        bloom_file = f"{self.config.save_file}.bloom"
+        if not self.save:
+            BloomFilter.remove(bloom_file)
+        self.seen = BloomFilter(
+            bloom_file, self.config.bloom_capacity, self.config.bloom_error)
+        if self.seen.created:
+            for urlhash in self.save.hashes():
+                self.seen.add(urlhash)
+        metrics.gauge("queue_depth", self.queue_depth)
+        if self.from_seeds:
             for url in self.config.seed_urls:
                 self.add_url(url)
         else:
-            # Set the frontier state with contents of save file.
-            self._parse_save_file()
-            if not self.save:
-                for url in self.config.seed_urls:
-                    self.add_url(url)
+            # Set the frontier state with contents of save file, in the
+            # background so workers can start on the first urls loaded.
+            self.loading = True
+            self.loader = Thread(target=self._parse_save_file, daemon=True)
+            self.loader.start()
 
     def _parse_save_file(self):
-        ''' This function can be overridden for alternate saving techniques. '''
-        total_count = len(self.save)
-        tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
-        self.logger.info(
-            f"Found {tbd_count} urls to be downloaded from {total_count} "
-            f"total urls discovered.")
+        ''' This function can be overridden for alternate saving techniques.
+            Runs on a background thread; the frontier keeps handing out urls
+            while it does, and only runs out once it has returned. '''
+        try:
+            total_count = len(self.save)
+            tbd_count = self._load(self.save.pending())
+            self.logger.info(
+                f"Found {tbd_count} urls to be downloaded from {total_count} "
+                f"total urls discovered.")
+            if self.config.refresh:
+                refresh_count = self._load(self.save.downloaded())
+                self.logger.info(
+                    f"Queued {refresh_count} downloaded urls to be refreshed.")
+        finally:
+            with self.lock:
+                self.loading = False
+                self.lock.notify_all()
+
+    def _load(self, urls):
+        ''' Queues the valid urls of (url, depth) pairs, LOAD_BATCH at a time,
+            and returns how many there were. '''
+        count = 0
+        while True:
+            batch = list(itertools.islice(urls, self.LOAD_BATCH))
+            if not batch:
+                return count
+            # Checked and hashed outside the lock.
+            batch = [
+                (get_urlhash(url.rstrip('/')), url, depth)
+                for url, depth in batch if is_valid(url)]
+            with self.lock:
+                for urlhash, url, depth in batch:
+                    self._queue(urlhash, url, depth)
+                self.lock.notify_all()
+            count += len(batch)
+
+    def _queue(self, urlhash, url, depth):
+        ''' Scores and queues a url that has not been downloaded yet. '''
+        netloc = parse_url(url).netloc
+        host_id = self.host_ids.get(netloc)
+        if host_id is None:
+            host_id = self.host_ids[netloc] = len(self.host_counts)
+            self.host_counts.append(0)
+        rank = self.host_counts[host_id]
+        self.host_counts[host_id] = rank + 1
+        seq = next(self.queued_count)
+        key = self.score(depth, 0, rank, seq)
+        queue = self.queues.get(host_id)
+        if queue is None:
+            # Urls are stored without this prefix.
+            prefix = url[:url.find(netloc) + len(netloc)]
+            queue = self.queues[host_id] = HostQueue(prefix)
+            self._new_host(host_id)
+        slot = queue.append(url, depth, rank, seq, key)
+        self.pending.put(short_digest(urlhash), host_id << 32 | slot)
+        self._offer(host_id, key)
+
+    def _relink(self, location, depth):
+        ''' Rescores a waiting url that was linked to again. '''
+        host_id, slot = location >> 32, location & MASK32
+        queue = self.queues[host_id]
+        queue.inlinks[slot] += 1
+        if depth < queue.depths[slot]:
+            queue.depths[slot] = depth
+        key = self.score(
+            queue.depths[slot], queue.inlinks[slot], queue.ranks[slot],
+            queue.seqs[slot])
+        if key != queue.keys[slot]:
+            queue.rekey(slot, key)
+            self._offer(host_id, key)
+
+    def _new_host(self, host_id):
+        ''' Called when a host gets a queue. Overridden by frontiers that
+            schedule hosts. '''
+
+    def _offer(self, host_id, key):
+        ''' Called when a url is queued for a host with the given key. Every
+            host with queued urls is eligible here. '''
+        best = self.eligible_keys.get(host_id)
+        if best is None or key < best:
+            self._make_eligible(host_id, key)
+
+    def _make_eligible(self, host_id, key):
+        heapq.heappush(self.eligible, key << 32 | host_id)
+        self.eligible_keys[host_id] = key
+
+    def _pop_eligible(self):
+        ''' Takes the best url of the best eligible host off its queue and
+            returns (host id, url), or (None, None) if no host is eligible. '''
+        while self.eligible:
+            entry = heapq.heappop(self.eligible)
+            host_id, key = entry & MASK32, entry >> 32
+            if self.eligible_keys.get(host_id) != key:
+                # Superseded by a better url queued for the host.
+                continue
+            del self.eligible_keys[host_id]
+            return host_id, self._take(host_id)
+        return None, None
+
+    def _take(self, host_id):
+        ''' Hands the best url of a host's queue to a worker. '''
+        queue = self.queues[host_id]
+        slot = queue.pop()
+        url = queue.url(slot)
+        self.pending.pop(short_digest(get_urlhash(url.rstrip('/'))))
+        self.in_flight[url] = queue.depths[slot]
+        if not queue:
+            del self.queues[host_id]
+        elif queue.wasted():
+            queue.compact()
+            for new_slot in range(len(queue)):
+                urlhash = get_urlhash(queue.url(new_slot).rstrip('/'))
+                self.pending.put(
+                    short_digest(urlhash), host_id << 32 | new_slot)
+        return url
+
+    def queue_depth(self):
+        ''' Number of urls waiting to be downloaded. '''
+        return len(self.pending)
 
     def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+        with self.lock:
+            host_id, url = self._pop_eligible()
+            while url is None and self.loading:
+                # Wait for the next urls from the save file.
+                self.lock.wait()
+                host_id, url = self._pop_eligible()
+            if host_id in self.queues:
+                self._make_eligible(host_id, self.queues[host_id].best())
+            return url
 
-    def add_url(self, url):
+    def add_url(self, url, parent=None, depth=None):
+        ''' Queues url if it hasn't been seen before. parent is the url of
+            the page it was found on, if any, which sets its depth, unless
+            the depth is given (for links from another shard's page). '''
         # url = normalize(url)
         urlhash = get_urlhash(url.rstrip('/'))
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
+        with self.lock:
+            if depth is None:
+                depth = self.in_flight.get(parent, -1) + 1
+            # Only urls the filter may have seen need the exact check.
+            if urlhash not in self.seen or urlhash not in self.save:
+                self.seen.add(urlhash)
+                self.save.add(urlhash, url, depth)
+                self._queue(urlhash, url, depth)
+            else:
+                location = self.pending.get(short_digest(urlhash))
+                if location is not None:
+                    self._relink(location, depth)
     
-    def mark_url_complete(self, url):
+    def previous_page(self, url):
+        ''' The PageRecord saved when url was downloaded by an earlier crawl,
+            if this is a refresh crawl. '''
+        if not self.config.refresh:
+            return None
+        return self.save.page(get_urlhash(url.rstrip('/')))
+
+    def mark_url_complete(self, url, page=None, status=None, latency=None):
+        ''' Records url as downloaded, with its PageRecord if it was. status
+            and latency are those of its download, for frontiers that adapt
+            to them, or None if the cache server itself failed. '''
         urlhash = get_urlhash(url.rstrip('/'))
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
+        with self.lock:
+            depth = self.in_flight.pop(url, 0)
+            if urlhash not in self.save:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            self.save.complete(urlhash, url, depth, page)
+
+    def close(self):
+        ''' Flushes and closes the save file once crawling has stopped. '''
+        if self.loader is not None:
+            self.loader.join()
+        with self.lock:
+            self.save.close()
+            self.seen.close()
+
+
+class PoliteFrontier(Frontier):
+    ''' Thread safe frontier that keeps one queue per host. A host is handed
+        to at most one worker at a time, and only becomes eligible again
+        some time after its last download completed: at least
+        config.time_delay seconds, more if the host is slow or failing (see
+        RateControl). Workers can crawl different hosts in parallel while
+        each host still gets the politeness spacing. Among the eligible
+        hosts, the one with the best scored url goes first. '''
+    polite = True
+
+    def __init__(self, config, restart):
+        # Heap of (ready time, host id) for hosts that have queued urls and
+        # are neither eligible nor being downloaded from.
+        self.ready = list()
+        # Hosts that have a url out with a worker.
+        self.busy = set()
+        # host id -> earliest time the next request to it may be sent.
+        self.next_request = dict()
+        self.rates = RateControl(config)
+        super().__init__(config, restart)
+        metrics.gauge("busy_hosts", lambda: len(self.busy))
+
+    def _new_host(self, host_id):
+        if host_id not in self.busy:
+            heapq.heappush(
+                self.ready, (self.next_request.get(host_id, 0), host_id))
+
+    def _offer(self, host_id, key):
+        # Waiting and busy hosts are made eligible with their best key later.
+        best = self.eligible_keys.get(host_id)
+        if best is not None and key < best:
+            self._make_eligible(host_id, key)
+
+    def poll_tbd_url(self):
+        ''' Non-blocking version of get_tbd_url. Returns (url, 0) if some
+            host is eligible, (None, seconds) if the next host becomes
+            eligible in that many seconds (or the save file is still loading
+            and may add one), (None, math.inf) if every queued host is out
+            with a worker, and (None, None) once the frontier is
+            exhausted. '''
+        with self.lock:
+            now = time.time()
+            while self.ready and self.ready[0][0] <= now:
+                _, host_id = heapq.heappop(self.ready)
+                self._make_eligible(host_id, self.queues[host_id].best())
+            host_id, url = self._pop_eligible()
+            if url is not None:
+                self.busy.add(host_id)
+                return url, 0
+            if self.ready:
+                wait = self.ready[0][0] - now
+            elif self.busy or self.loading:
+                wait = math.inf
+            else:
+                return None, None
+            if self.loading:
+                wait = min(wait, self.LOAD_WAIT)
+            return None, wait
+
+    def get_tbd_url(self):
+        ''' Blocks until some host is eligible and returns its next url.
+            Returns None once every queue is empty and no worker is still
+            downloading a page that could add more urls. '''
+        with self.lock:
+            while True:
+                url, wait = self.poll_tbd_url()
+                if url is not None or wait is None:
+                    return url
+                self.lock.wait(None if wait == math.inf else wait)
+
+    def add_url(self, url, parent=None, depth=None):
+        with self.lock:
+            super().add_url(url, parent, depth)
+            self.lock.notify()
+
+    def mark_url_complete(self, url, page=None, status=None, latency=None):
+        netloc = parse_url(url).netloc
+        with self.lock:
+            super().mark_url_complete(url, page, status, latency)
+            host_id = self.host_ids.get(netloc)
+            if host_id not in self.busy:
+                return
+            self.busy.remove(host_id)
+            self.next_request[host_id] = (
+                time.time() + self.rates.update(host_id, status, latency))
+            if host_id in self.queues:
+                heapq.heappush(
+                    self.ready, (self.next_request[host_id], host_id))
+            self.lock.notify_all()
+
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+FRONTIERS = {"basic": Frontier, "polite": PoliteFrontier}
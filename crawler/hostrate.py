@@ -0,0 +1,87 @@
+from utils.metrics import metrics
+
+# The cache server's status when it failed to download a page from its host.
+# Its other statuses from 600 up reject the url without asking the host.
+DOWNLOAD_FAILED = 601
+
+
+def from_host(status):
+    ''' Whether a download's status says how its host answered. '''
+    return status < 600 or status == DOWNLOAD_FAILED
+
+
+def failed(status):
+    ''' Whether a download's status says its host is struggling: a timeout,
+        too many requests, a server error, or the cache server failing to
+        download from it. '''
+    return status in (408, 429, DOWNLOAD_FAILED) or 500 <= status <= 599
+
+
+class HostRate(object):
+    ''' What is known about one host: its current delay, its download
+        latency averaged over recent requests, and how many downloads in a
+        row have failed. '''
+    __slots__ = ("delay", "latency", "failures")
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.latency = None
+        self.failures = 0
+
+
+class RateControl(object):
+    ''' Adapts the delay between requests to each host to how it answers,
+        AIMD style: a failed download doubles the host's delay (to at least
+        FIRST_BACKOFF seconds) up to config.max_time_delay, and every other
+        download takes RECOVER_STEP seconds off it, down to
+        config.time_delay. A host whose average latency is over
+        SLOW_LATENCY seconds is also never asked more often than that, so
+        slow hosts are spaced out before they fail.
+        After config.park_after failures in a row a host is parked for
+        config.park_time seconds, so workers move on to other hosts. '''
+    BACKOFF = 2
+    FIRST_BACKOFF = 0.25
+    RECOVER_STEP = 0.25
+    LATENCY_WEIGHT = 0.25
+    SLOW_LATENCY = 1.0
+
+    def __init__(self, config):
+        self.min_delay = config.time_delay
+        self.max_delay = max(config.max_time_delay, config.time_delay)
+        self.park_after = config.park_after
+        self.park_time = config.park_time
+        # host -> HostRate, for hosts downloaded from.
+        self.hosts = dict()
+
+    def update(self, host, status=None, latency=None):
+        ''' Records a download from host, with its status and latency in
+            seconds if known, and returns how many seconds to wait before
+            the next request to it. Statuses the cache server gave without
+            asking the host (see from_host) are ignored, like failures of
+            the cache server itself, which have neither. '''
+        if status is not None and not from_host(status):
+            status = latency = None
+        rate = self.hosts.get(host)
+        if rate is None:
+            rate = self.hosts[host] = HostRate(self.min_delay)
+        if latency is not None:
+            if rate.latency is None:
+                rate.latency = latency
+            else:
+                rate.latency += self.LATENCY_WEIGHT * (latency - rate.latency)
+        if status is not None:
+            if failed(status):
+                rate.failures += 1
+                rate.delay = min(
+                    self.max_delay,
+                    max(rate.delay * self.BACKOFF, self.FIRST_BACKOFF))
+                if self.park_after and rate.failures >= self.park_after:
+                    metrics.counter("parked").inc()
+                    return max(self.park_time, rate.delay)
+            else:
+                rate.failures = 0
+                rate.delay = max(
+                    self.min_delay, rate.delay - self.RECOVER_STEP)
+        if rate.latency is None or rate.latency <= self.SLOW_LATENCY:
+            return rate.delay
+        return max(rate.delay, min(rate.latency, self.max_delay))
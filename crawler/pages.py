@@ -0,0 +1,37 @@
+import hashlib
+
+from collections import namedtuple
+
+# What the save file keeps about a downloaded page so a later refresh crawl
+# can tell whether it changed: its ETag and Last-Modified headers (None if it
+# had none), a digest of its content, and the links scraped from it.
+PageRecord = namedtuple(
+    "PageRecord", ["etag", "last_modified", "digest", "links"])
+
+
+def page_record(resp, links=()):
+    ''' The PageRecord to save for a downloaded page, or None if it wasn't
+        a successful download. '''
+    if not 200 <= resp.status <= 299:
+        return None
+    raw = resp.raw_response
+    if raw is None:
+        return None
+    digest = hashlib.blake2b(raw.content or b"", digest_size=16).hexdigest()
+    return PageRecord(
+        raw.headers.get("ETag"), raw.headers.get("Last-Modified"), digest,
+        list(links))
+
+
+def unchanged(previous, page):
+    ''' Whether page is the same as the previous PageRecord of its url: the
+        ETags match, or without ETags the Last-Modified dates do, or the
+        content is byte for byte the same. '''
+    if previous is None or page is None:
+        return False
+    if page.etag and previous.etag:
+        if page.etag == previous.etag:
+            return True
+    elif page.last_modified and page.last_modified == previous.last_modified:
+        return True
+    return page.digest == previous.digest
@@ -0,0 +1,63 @@
+import os
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from threading import Lock
+
+import scraper
+
+
+class ParsePool(object):
+    ''' Scrapes pages with the html parsing done on a pool of processes, so
+        it isn't serialized with every other worker thread by the GIL.
+        Checking the response, counting words and writing urls.txt stay in
+        the calling thread; only (url, content) crosses to the pool, and the
+        pool sends back the page's links, text length and word counts.
+        Callers wait for their page, so the pool has at most one page per
+        calling thread to parse. '''
+    def __init__(self, processes, extractor='bs4'):
+        # Spawned rather than forked: the crawler process has threads running.
+        self.executor = ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("spawn"))
+        self.extractor = extractor
+
+    def scraper(self, url, resp, revisit=False):
+        ''' Same contract as scraper.scraper. '''
+        url = scraper.crawlable_url(url, resp)
+        if url is None:
+            return []
+        page = self.executor.submit(
+            scraper.parse_page, url, resp.raw_response.content,
+            self.extractor).result()
+        links = scraper.record_page(url, page, revisit)
+        return [link for link in links if scraper.is_valid(link)]
+
+    def close(self):
+        self.executor.shutdown()
+
+
+_pool = None
+_pool_lock = Lock()
+
+def get_scraper(config):
+    ''' Returns the scraper function to use for config.parser: scraper.scraper
+        for "inline", or the scraper of a ParsePool shared by every worker for
+        "process". Either one parses with config.extractor. '''
+    global _pool
+    if config.parser == "inline":
+        return partial(scraper.scraper, extractor=config.extractor)
+    with _pool_lock:
+        if _pool is None:
+            _pool = ParsePool(
+                config.parse_processes or os.cpu_count(), config.extractor)
+    return _pool.scraper
+
+def close_pool():
+    ''' Shuts down the shared ParsePool, if there is one, once its crawl is
+        over; the next get_scraper starts a new one. '''
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
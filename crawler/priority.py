@@ -0,0 +1,29 @@
+# Scoring functions for the frontier. Each gets a queued url's link depth
+# from the seeds, how many times it was linked to while waiting, how many urls
+# of its host were queued before it and the order it was queued in, and
+# returns an int key between -2**31 and 2**31; urls with lower keys are
+# downloaded first.
+
+def by_depth(depth, inlinks, host_rank, seq):
+    ''' Breadth first: fewest links away from a seed. '''
+    return depth
+
+
+def by_host(depth, inlinks, host_rank, seq):
+    ''' Round robin over hosts: each host's n-th url comes before any
+        host's n+1-th. '''
+    return host_rank
+
+
+def by_inlinks(depth, inlinks, host_rank, seq):
+    ''' Most linked to first, then breadth first. '''
+    return depth - (min(inlinks, 0x7fff) << 16)
+
+
+def by_lifo(depth, inlinks, host_rank, seq):
+    ''' Last queued first, the order of the original list frontier. '''
+    return -seq
+
+
+SCORERS = {
+    "depth": by_depth, "host": by_host, "inlinks": by_inlinks, "lifo": by_lifo}
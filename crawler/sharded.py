@@ -0,0 +1,271 @@
+import os
+import time
+import zlib
+import multiprocessing
+
+from functools import partial
+from queue import Empty
+from threading import Thread
+
+from utils import get_logger, get_urlhash
+from utils.metrics import metrics, StatsReporter
+from utils.urls import parse_url
+
+
+def shard_of(url, shards):
+    ''' The shard that crawls url: every url of a host goes to the same one,
+        so each shard's frontier can keep the host's politeness on its own. '''
+    return zlib.crc32(parse_url(url).netloc.encode("utf-8")) % shards
+
+
+class ShardCoordinator(object):
+    ''' State shared by the shard processes to tell when the whole crawl is
+        out of urls: every shard is idle and no message (a batch of urls, or
+        the answer that they were saved) is on its way from one shard to
+        another. A shard only stops being idle when it receives a message,
+        and it is marked busy in the same step that takes the message out of
+        transit, so once done is true it stays true. '''
+    def __init__(self, shards, context):
+        self.lock = context.Lock()
+        self.in_transit = context.Value("q", 0, lock=False)
+        self.idle = context.Array("b", shards, lock=False)
+
+    def sending(self):
+        with self.lock:
+            self.in_transit.value += 1
+
+    def received(self, shard):
+        with self.lock:
+            self.idle[shard] = 0
+            self.in_transit.value -= 1
+
+    def set_idle(self, shard):
+        with self.lock:
+            self.idle[shard] = 1
+
+    def done(self):
+        with self.lock:
+            return self.in_transit.value == 0 and all(self.idle)
+
+
+class ShardFrontier(object):
+    ''' Mixed in before a frontier class to make it one shard's frontier
+        (see shard_frontier). Urls of this shard's hosts are queued as
+        usual; urls of other shards' hosts are still recorded in this
+        shard's save file, so they are saved before the page they were found
+        on is completed, but are batched with their depth and sent to their
+        shard's inbox instead of being queued. A batch goes once SEND_BATCH
+        urls are waiting, SEND_INTERVAL seconds have passed, or this shard
+        runs out of urls. Once their shard has saved them it says so, and
+        they are recorded as complete here; on a restart the ones that
+        weren't yet are sent again, and their shard drops those it already
+        has. A background thread handles the messages arriving in this
+        shard's inbox.
+
+        Workers that run out of urls wait for more from other shards until
+        the coordinator says every shard is done. '''
+    SEND_BATCH = 256
+    SEND_INTERVAL = 0.5
+    IDLE_WAIT = 0.1
+
+    def __init__(self, config, restart, shard, inboxes, coordinator):
+        self.polls = hasattr(super(), "poll_tbd_url")
+        if config.engine == "async" and not self.polls:
+            raise TypeError(
+                f"{type(self).__bases__[-1].__name__} does not support "
+                f"poll_tbd_url, which the async engine needs.")
+        self.shard = shard
+        self.shards = len(inboxes)
+        self.inboxes = inboxes
+        self.coordinator = coordinator
+        self.threads = config.threads_count
+        # Guarded by the frontier lock, like the rest of its state.
+        self.outboxes = [list() for _ in inboxes]
+        self.last_send = time.time()
+        self.waiting = 0
+        # Set first: the save file may already be loading urls to send.
+        super().__init__(config, restart)
+        self.receiver = Thread(target=self._receive, daemon=True)
+        self.receiver.start()
+
+    def _receive(self):
+        ''' Handles the messages in this shard's inbox: ("urls", sender,
+            batch) to add a batch of (url, depth) from another shard, and
+            ("saved", batch) once a batch this shard sent is saved by its
+            shard, until None. '''
+        inbox = self.inboxes[self.shard]
+        while True:
+            message = inbox.get()
+            if message is None:
+                return
+            # Under the lock, so no worker can mark the shard idle between
+            # it becoming busy and the message being handled.
+            with self.lock:
+                self.coordinator.received(self.shard)
+                if message[0] == "urls":
+                    _, sender, batch = message
+                    for url, depth in batch:
+                        self.add_url(url, depth=depth)
+                    # Committed before the sender stops keeping them.
+                    self.save.sync()
+                    self._put(sender, ("saved", batch))
+                else:
+                    # Recorded as complete here, so a restart doesn't send
+                    # them again.
+                    for url, depth in message[1]:
+                        self.save.complete(
+                            get_urlhash(url.rstrip('/')), url, depth)
+                self.lock.notify_all()
+
+    def _put(self, shard, message):
+        # Counted before it is sent, so it is never both out of transit and
+        # not yet received.
+        self.coordinator.sending()
+        self.inboxes[shard].put(message)
+
+    def _send(self):
+        ''' Sends every waiting url to its shard. Call with the lock held. '''
+        for shard, outbox in enumerate(self.outboxes):
+            if outbox:
+                self._put(shard, ("urls", self.shard, outbox))
+                self.outboxes[shard] = list()
+        self.last_send = time.time()
+
+    def _queue(self, urlhash, url, depth):
+        shard = shard_of(url, self.shards)
+        if shard == self.shard:
+            super()._queue(urlhash, url, depth)
+            return
+        outbox = self.outboxes[shard]
+        outbox.append((url, depth))
+        if (len(outbox) >= self.SEND_BATCH
+                or time.time() - self.last_send > self.SEND_INTERVAL):
+            self._send()
+
+    def _go_idle(self):
+        ''' Sends what is waiting and marks this shard out of urls, and
+            returns whether every shard is. Call with the lock held. '''
+        self._send()
+        self.coordinator.set_idle(self.shard)
+        return self.coordinator.done()
+
+    def get_tbd_url(self):
+        if self.polls:
+            # Waits on poll_tbd_url below, which knows when the shard is idle.
+            return super().get_tbd_url()
+        with self.lock:
+            while True:
+                url = super().get_tbd_url()
+                if url is not None:
+                    return url
+                # Other workers may still add urls until all of them wait.
+                self.waiting += 1
+                if self.waiting == self.threads and self._go_idle():
+                    return None
+                self.lock.wait(self.IDLE_WAIT)
+                self.waiting -= 1
+
+    def poll_tbd_url(self):
+        with self.lock:
+            url, wait = super().poll_tbd_url()
+            if url is not None or wait is not None:
+                return url, wait
+            # Nothing queued or out with a worker in this shard.
+            if self._go_idle():
+                return None, None
+            return None, self.IDLE_WAIT
+
+    def close(self):
+        self.inboxes[self.shard].put(None)
+        self.receiver.join()
+        super().close()
+
+
+def shard_frontier(frontier_factory):
+    ''' The frontier class frontier_factory with ShardFrontier mixed in. '''
+    return type(
+        f"Sharded{frontier_factory.__name__}", (ShardFrontier, frontier_factory),
+        {})
+
+
+class ShardedCrawler(object):
+    ''' Crawls with config.shards processes, each running the crawler of
+        config.engine with config.threads_count workers over its own share
+        of the hosts. Shard i saves its progress to the save file with a
+        .shard<i> suffix, so a crawl has to be resumed with the same number
+        of shards. Word frequencies and urls.txt are shared by all of them;
+        near-duplicate pages are only detected within a shard. The metrics
+        of every shard are added up when the crawl ends. '''
+    def __init__(self, config, restart, frontier_factory):
+        self.config = config
+        self.restart = restart
+        self.frontier_factory = frontier_factory
+        self.logger = get_logger("CRAWLER")
+        shards_file = f"{config.save_file}.shards"
+        if not restart and os.path.exists(shards_file):
+            with open(shards_file) as saved:
+                saved_shards = int(saved.read())
+            if saved_shards != config.shards:
+                raise ValueError(
+                    f"{config.save_file} was crawled with {saved_shards} "
+                    f"shards; set SHARDS = {saved_shards} or use --restart.")
+        with open(shards_file, "w") as saved:
+            saved.write(str(config.shards))
+
+    def start(self):
+        # Spawned rather than forked, like the parse pool.
+        context = multiprocessing.get_context("spawn")
+        inboxes = [context.Queue() for _ in range(self.config.shards)]
+        coordinator = ShardCoordinator(self.config.shards, context)
+        results = context.Queue()
+        stats = StatsReporter(self.logger, 0, 0, self.config.stats_file)
+        stats.start()
+        processes = [
+            context.Process(
+                target=_run_shard,
+                args=(shard, self.config, self.restart, self.frontier_factory,
+                      inboxes, coordinator, results))
+            for shard in range(self.config.shards)]
+        for process in processes:
+            process.start()
+        finished = 0
+        while finished < len(processes):
+            try:
+                shard, exported = results.get(timeout=1)
+            except Empty:
+                # Stop everything if a shard died without reporting, since
+                # the others would wait for it forever.
+                failed = [
+                    process for process in processes
+                    if process.exitcode not in (None, 0)]
+                if failed:
+                    for process in processes:
+                        process.terminate()
+                    raise RuntimeError(
+                        f"Shard process exited with code {failed[0].exitcode}.")
+                continue
+            metrics.merge(exported)
+            finished += 1
+        for process in processes:
+            process.join()
+        stats.stop()
+
+
+def _run_shard(shard, config, restart, frontier_factory, inboxes, coordinator,
+               results):
+    ''' Runs one shard's crawler in its own process. '''
+    from crawler import Crawler
+    from crawler.async_crawler import AsyncCrawler
+    shards = config.shards
+    config.seed_urls = [
+        url for url in config.seed_urls if shard_of(url, shards) == shard]
+    config.save_file = f"{config.save_file}.shard{shard}"
+    config.stats_file = f"{os.path.splitext(config.stats_file)[0]}-shard{shard}.json"
+    if config.stats_port:
+        config.stats_port += shard
+    crawler_factory = AsyncCrawler if config.engine == "async" else Crawler
+    crawler = crawler_factory(config, restart, frontier_factory=partial(
+        shard_frontier(frontier_factory), shard=shard, inboxes=inboxes,
+        coordinator=coordinator))
+    crawler.start()
+    results.put((shard, metrics.export()))
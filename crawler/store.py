@@ -0,0 +1,422 @@
+import os
+import dbm
+import json
+import pickle
+import shelve
+
+from threading import Thread, Lock, Event
+
+from utils.digests import DigestSet, DigestMap, short_digest
+from crawler.pages import PageRecord
+
+
+class ShelveStore(object):
+    ''' The original frontier save format: a shelve mapping each url hash to
+        (url, completed, depth), or (url, True, depth, page) once downloaded
+        where page is a PageRecord as a tuple, flushed to disk on every
+        write. '''
+    # Files dbm.dumb keeps a shelve in, instead of the save file itself.
+    DUMB_SUFFIXES = (".dat", ".dir", ".bak")
+
+    def __init__(self, save_file, config):
+        self.save = shelve.open(save_file)
+
+    @staticmethod
+    def exists(save_file):
+        return dbm.whichdb(save_file) is not None
+
+    @staticmethod
+    def remove(save_file):
+        for path in [save_file] + [
+                save_file + suffix for suffix in ShelveStore.DUMB_SUFFIXES]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __contains__(self, urlhash):
+        return urlhash in self.save
+
+    def __len__(self):
+        return len(self.save)
+
+    def add(self, urlhash, url, depth=0):
+        self.save[urlhash] = (url, False, depth)
+        self.save.sync()
+
+    def complete(self, urlhash, url, depth=0, page=None):
+        self.save[urlhash] = (url, True, depth, tuple(page) if page else None)
+        self.save.sync()
+
+    def page(self, urlhash):
+        ''' The PageRecord of a downloaded url, or None. '''
+        record = self.save.get(urlhash)
+        if record is None or len(record) < 4 or record[3] is None:
+            return None
+        return PageRecord(*record[3])
+
+    def hashes(self):
+        return iter(self.save.keys())
+
+    def pending(self):
+        ''' Yields (url, depth) for every url not downloaded yet. '''
+        for record in self.save.values():
+            # Saves from before depths were kept have (url, completed).
+            if not record[1]:
+                yield record[0], record[2] if len(record) > 2 else 0
+
+    def downloaded(self):
+        ''' Yields (url, depth) for every downloaded url. '''
+        for record in self.save.values():
+            if record[1]:
+                yield record[0], record[2] if len(record) > 2 else 0
+
+    def sync(self):
+        self.save.sync()
+
+    def close(self):
+        self.save.close()
+
+
+class LogStore(object):
+    ''' Append-only frontier save file. Only the sets of seen and completed
+        url digests are kept in memory, as DigestSets; every discovered url is appended to the
+        log as one json record [urlhash, url, false, depth], and every
+        completed one as [urlhash, url, true, depth, page] where page is its
+        PageRecord as a list, or null. A url downloaded again by a refresh
+        crawl gets another completed record, and the last one holds its
+        current page. With config.refresh set, the offsets of the completed
+        records are indexed on load so their pages can be read back.
+
+        Records are group committed: they are buffered and written with a
+        single fsync once config.commit_batch records are waiting, or every
+        config.commit_interval seconds from a background thread, so a crash
+        loses at most the last uncommitted batch. The log is compacted, also
+        by the background thread, when it holds COMPACT_RATIO times more
+        records than there are urls.
+
+        The in-memory state, with the offset of the record that discovered
+        each url not downloaded yet, is checkpointed to the save file's
+        .index file on close, after compaction and after loading. A start
+        with a checkpoint only replays the records appended after it, and
+        pending reads just the records of pending urls. '''
+    COMPACT_RATIO = 1.5
+    COMPACT_MIN_RECORDS = 10000
+    CHECKPOINT_VERSION = 1
+
+    def __init__(self, save_file, config):
+        self.path = save_file
+        self.index_path = f"{save_file}.index"
+        self.batch_size = config.commit_batch
+        self.interval = config.commit_interval
+        self.seen = DigestSet()
+        self.completed = DigestSet()
+        # url digest -> offset of the record that discovered it, for urls
+        # not downloaded yet.
+        self.pending_offsets = DigestMap()
+        self.records = 0
+        # Bytes committed to the log, and waiting in the buffer.
+        self.size = 0
+        self.buffered = 0
+        self.buffer = list()
+        self.lock = Lock()
+        # Set once the log has grown enough to compact, by _commit.
+        self.compact_due = False
+        # url digest -> offset of its last completed record, in refresh mode.
+        self.page_offsets = DigestMap() if config.refresh else None
+        self.reader = None
+        if os.path.exists(self.path):
+            start = self._load_checkpoint()
+            if self._replay(start) or not start:
+                self._checkpoint()
+        self.log = open(self.path, "ab")
+        self.closed = Event()
+        self.flusher = Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    @staticmethod
+    def exists(save_file):
+        return os.path.exists(save_file)
+
+    @staticmethod
+    def remove(save_file):
+        os.remove(save_file)
+        if os.path.exists(f"{save_file}.index"):
+            os.remove(f"{save_file}.index")
+
+    def _records(self, end=None):
+        ''' Yields every committed record, or those before offset end. '''
+        offset = 0
+        with open(self.path, "rb") as log:
+            for line in log:
+                if end is not None and offset >= end:
+                    return
+                offset += len(line)
+                yield json.loads(line)
+
+    def _log_id(self):
+        stat = os.stat(self.path)
+        return stat.st_dev, stat.st_ino
+
+    def _load_checkpoint(self):
+        ''' Loads the checkpoint if it matches the log, and returns the
+            log offset it covers up to, or 0. '''
+        if self.page_offsets is not None:
+            # Page offsets aren't checkpointed; refresh replays everything.
+            return 0
+        try:
+            with open(self.index_path, "rb") as index:
+                state = pickle.load(index)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return 0
+        if (state.get("version") != self.CHECKPOINT_VERSION
+                or state["log"] != self._log_id()
+                or state["size"] > os.path.getsize(self.path)):
+            # From an older log, say one replaced by a compaction whose
+            # checkpoint was never written.
+            return 0
+        self.seen = state["seen"]
+        self.completed = state["completed"]
+        self.pending_offsets = state["pending"]
+        self.records = state["records"]
+        self.size = state["size"]
+        return self.size
+
+    def _checkpoint(self):
+        ''' Saves the state of the committed log to the index file. '''
+        state = {
+            "version": self.CHECKPOINT_VERSION, "log": self._log_id(),
+            "size": self.size, "records": self.records, "seen": self.seen,
+            "completed": self.completed, "pending": self.pending_offsets}
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "wb") as index:
+            pickle.dump(state, index, protocol=pickle.HIGHEST_PROTOCOL)
+            index.flush()
+            os.fsync(index.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    def _replay(self, start):
+        ''' Loads the records from offset start on and returns how many
+            there were. '''
+        valid_bytes = start
+        replayed = 0
+        with open(self.path, "rb") as log:
+            log.seek(start)
+            for line in log:
+                # A torn write from a crash, even one that only lost its
+                # newline (the next batch would be appended to its line);
+                # drop it and everything after.
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                    urlhash, url, completed = record[:3]
+                except ValueError:
+                    break
+                self._index_record(record, valid_bytes)
+                valid_bytes += len(line)
+                replayed += 1
+        self.records += replayed
+        self.size = valid_bytes
+        if valid_bytes < os.path.getsize(self.path):
+            with open(self.path, "r+b") as log:
+                log.truncate(valid_bytes)
+        return replayed
+
+    def _index_record(self, record, offset):
+        ''' Adds a record at the given log offset to the in-memory state. '''
+        urlhash = record[0]
+        if record[2]:
+            self.seen.add(urlhash)
+            self.completed.add(urlhash)
+            self.pending_offsets.pop(short_digest(urlhash))
+            if (self.page_offsets is not None and len(record) > 4
+                    and record[4] is not None):
+                self.page_offsets.put(short_digest(urlhash), offset)
+        elif self.seen.add(urlhash):
+            self.pending_offsets.put(short_digest(urlhash), offset)
+
+    def __contains__(self, urlhash):
+        return urlhash in self.seen
+
+    def __len__(self):
+        return len(self.seen)
+
+    def add(self, urlhash, url, depth=0):
+        with self.lock:
+            self._append([urlhash, url, False, depth])
+
+    def complete(self, urlhash, url, depth=0, page=None):
+        with self.lock:
+            self._append([urlhash, url, True, depth, page])
+
+    def page(self, urlhash):
+        ''' The PageRecord of a url downloaded before this run, or None.
+            Only indexed in refresh mode. '''
+        if self.page_offsets is None:
+            return None
+        with self.lock:
+            offset = self.page_offsets.get(short_digest(urlhash))
+            if offset is None:
+                return None
+            if self.reader is None:
+                self.reader = open(self.path, "rb")
+            self.reader.seek(offset)
+            record = json.loads(self.reader.readline())
+        return PageRecord(*record[4])
+
+    def hashes(self):
+        return iter(self.seen)
+
+    def pending(self):
+        ''' Yields (url, depth) for every url not downloaded yet, reading
+            only their records. '''
+        with self.lock:
+            self._commit()
+            offsets = sorted(offset for _, offset in self.pending_offsets.items())
+            # Still reads the records if a compaction replaces the log.
+            log = open(self.path, "rb")
+        with log:
+            for offset in offsets:
+                log.seek(offset)
+                record = json.loads(log.readline())
+                yield record[1], record[3]
+
+    def downloaded(self):
+        ''' Yields (url, depth) for every downloaded url. '''
+        with self.lock:
+            self._commit()
+        yielded = DigestSet()
+        for record in self._records():
+            if record[2] and yielded.add(record[0]):
+                yield record[1], record[3]
+
+    def _append(self, record):
+        # json.dumps escapes non-ascii characters, so the line's length is
+        # its size in bytes.
+        line = json.dumps(record) + "\n"
+        self._index_record(record, self.size + self.buffered)
+        self.buffer.append(line)
+        self.buffered += len(line)
+        if len(self.buffer) >= self.batch_size:
+            self._commit()
+
+    def _commit(self):
+        if not self.buffer:
+            return
+        self.log.write("".join(self.buffer).encode("utf-8"))
+        self.log.flush()
+        os.fsync(self.log.fileno())
+        self.records += len(self.buffer)
+        self.size += self.buffered
+        self.buffered = 0
+        self.buffer.clear()
+        if (self.records > self.COMPACT_MIN_RECORDS
+                and self.records > self.COMPACT_RATIO * len(self.seen)):
+            # Left to the flusher thread: the caller may be holding the
+            # frontier lock.
+            self.compact_due = True
+
+    def _compact(self):
+        ''' Rewrites the log keeping one record per url: its last completed
+            record if it has one, otherwise the record that discovered it.
+            The log committed so far is rewritten without the lock, so urls
+            can still be added meanwhile; the records committed since are
+            then copied over under the lock before the new log replaces
+            the old one. '''
+        with self.lock:
+            self.compact_due = False
+            self._commit()
+            end = self.size
+            pending_size = len(self.seen) - len(self.completed)
+        tmp_path = f"{self.path}.compact"
+        # url digest -> index of its last completed record.
+        last_completed = DigestMap()
+        for index, record in enumerate(self._records(end)):
+            if record[2]:
+                last_completed.put(short_digest(record[0]), index)
+        written = DigestSet()
+        records = 0
+        pending_offsets = DigestMap(pending_size)
+        page_offsets = None
+        if self.page_offsets is not None:
+            page_offsets = DigestMap(len(last_completed))
+        with open(tmp_path, "wb") as compacted:
+            for index, record in enumerate(self._records(end)):
+                urlhash, completed = record[0], record[2]
+                digest = short_digest(urlhash)
+                if completed:
+                    if last_completed.get(digest) != index:
+                        continue
+                elif (last_completed.get(digest) is not None
+                        or not written.add(urlhash)):
+                    continue
+                offset = compacted.tell()
+                if completed:
+                    if (page_offsets is not None and len(record) > 4
+                            and record[4] is not None):
+                        page_offsets.put(digest, offset)
+                else:
+                    pending_offsets.put(digest, offset)
+                compacted.write((json.dumps(record) + "\n").encode("utf-8"))
+                records += 1
+            with self.lock:
+                self._commit()
+                with open(self.path, "rb") as log:
+                    log.seek(end)
+                    old_offset, offset = end, compacted.tell()
+                    for line in log:
+                        record = json.loads(line)
+                        digest = short_digest(record[0])
+                        if record[2]:
+                            pending_offsets.pop(digest)
+                            if (page_offsets is not None and len(record) > 4
+                                    and record[4] is not None):
+                                page_offsets.put(digest, offset)
+                        elif self.pending_offsets.get(digest) == old_offset:
+                            pending_offsets.put(digest, offset)
+                        compacted.write(line)
+                        old_offset += len(line)
+                        offset += len(line)
+                        records += 1
+                compacted.flush()
+                os.fsync(compacted.fileno())
+                self.log.close()
+                if self.reader is not None:
+                    self.reader.close()
+                    self.reader = None
+                os.replace(tmp_path, self.path)
+                self.pending_offsets = pending_offsets
+                self.page_offsets = page_offsets
+                self.records = records
+                self.size = offset
+                self.log = open(self.path, "ab")
+                self._checkpoint()
+
+    def _flush_loop(self):
+        while not self.closed.wait(self.interval):
+            with self.lock:
+                self._commit()
+            if self.compact_due:
+                self._compact()
+
+    def sync(self):
+        with self.lock:
+            self._commit()
+
+    def close(self):
+        self.closed.set()
+        self.flusher.join()
+        with self.lock:
+            self._commit()
+            self.log.close()
+            self._checkpoint()
+            if self.reader is not None:
+                self.reader.close()
+
+
+def is_shelve(save_file):
+    ''' Whether save_file is a shelve, as written by the shelve store or by
+        crawlers from before there was a choice of store. '''
+    return bool(dbm.whichdb(save_file))
+
+
+STORES = {"shelve": ShelveStore, "log": LogStore}
@@ -0,0 +1,158 @@
+from array import array
+
+MASK32 = (1 << 32) - 1
+
+
+class IntHeap(object):
+    ''' Binary min-heap of 64 bit ints in an array: 8 bytes an entry instead
+        of a list slot and an int object. '''
+    def __init__(self, items=()):
+        self.items = array('q', sorted(items))
+
+    def __len__(self):
+        return len(self.items)
+
+    def top(self):
+        return self.items[0]
+
+    def push(self, item):
+        items = self.items
+        items.append(item)
+        position = len(items) - 1
+        while position:
+            parent = (position - 1) >> 1
+            if items[parent] <= item:
+                break
+            items[position] = items[parent]
+            position = parent
+        items[position] = item
+
+    def pop(self):
+        items = self.items
+        last = items.pop()
+        if not items:
+            return last
+        top = items[0]
+        end = len(items)
+        position = 0
+        child = 1
+        while child < end:
+            if child + 1 < end and items[child + 1] < items[child]:
+                child += 1
+            if last <= items[child]:
+                break
+            items[position] = items[child]
+            position = child
+            child = 2 * position + 1
+        items[position] = last
+        return top
+
+
+class HostQueue(object):
+    ''' The queued urls of one host. Urls are stored without their scheme
+        and host in a bytearray arena, front coded: each record is the
+        length of the prefix it shares with the one before (at most 255)
+        followed by the rest, with every RESTART-th record stored whole so
+        any url decodes from at most RESTART records. Their fields are kept
+        in parallel arrays indexed by slot.
+
+        heap holds key << 32 | slot for each url's current key, so keys must
+        fit in 32 bits; entries whose key has changed or whose url was taken
+        are skipped. Slots are not reused until compact. '''
+    RESTART = 16
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.data = bytearray()
+        # Slot i's record is data[offsets[i]:offsets[i + 1]].
+        self.offsets = array('I', [0])
+        self.last = b''
+        self.depths = array('i')
+        self.inlinks = array('i')
+        self.ranks = array('I')
+        self.seqs = array('I')
+        self.keys = array('i')
+        self.live = bytearray()
+        self.live_count = 0
+        self.heap = IntHeap()
+
+    def __len__(self):
+        return self.live_count
+
+    def append(self, url, depth, rank, seq, key):
+        ''' Queues url and returns its slot. '''
+        if url.startswith(self.prefix):
+            text = url[len(self.prefix):].encode('utf-8')
+        else:
+            # A different scheme or port; marked by a leading NUL.
+            text = b'\0' + url.encode('utf-8')
+        slot = len(self.live)
+        shared = 0
+        if slot % self.RESTART:
+            last = self.last
+            limit = min(len(text), len(last), 255)
+            while shared < limit and text[shared] == last[shared]:
+                shared += 1
+        self.data.append(shared)
+        self.data += text[shared:]
+        self.last = text
+        self.offsets.append(len(self.data))
+        self.depths.append(depth)
+        self.inlinks.append(0)
+        self.ranks.append(rank)
+        self.seqs.append(seq)
+        self.keys.append(key)
+        self.live.append(1)
+        self.live_count += 1
+        self.heap.push(key << 32 | slot)
+        return slot
+
+    def url(self, slot):
+        data, offsets = self.data, self.offsets
+        text = b''
+        for i in range(slot - slot % self.RESTART, slot + 1):
+            start = offsets[i]
+            text = text[:data[start]] + data[start + 1:offsets[i + 1]]
+        if text[:1] == b'\0':
+            return text[1:].decode('utf-8')
+        return self.prefix + text.decode('utf-8')
+
+    def rekey(self, slot, key):
+        self.keys[slot] = key
+        self.heap.push(key << 32 | slot)
+
+    def best(self):
+        ''' Key of the best queued url, or None if there is none. '''
+        heap = self.heap
+        while heap:
+            entry = heap.top()
+            slot = entry & MASK32
+            key = entry >> 32
+            if self.live[slot] and self.keys[slot] == key:
+                return key
+            heap.pop()
+        return None
+
+    def pop(self):
+        ''' Takes the best queued url off the queue and returns its slot. '''
+        self.best()
+        slot = self.heap.pop() & MASK32
+        self.live[slot] = 0
+        self.live_count -= 1
+        return slot
+
+    def wasted(self):
+        ''' Whether taken urls fill most of the arena. '''
+        return len(self.live) > 2 * self.live_count + 64
+
+    def compact(self):
+        ''' Drops taken urls, renumbering the slots of the rest in order. '''
+        old = HostQueue(self.prefix)
+        old.__dict__.update(self.__dict__)
+        self.__init__(self.prefix)
+        for slot in range(len(old.live)):
+            if old.live[slot]:
+                new_slot = self.append(
+                    old.url(slot), old.depths[slot], old.ranks[slot],
+                    old.seqs[slot], old.keys[slot])
+                self.inlinks[new_slot] = old.inlinks[slot]
@@ -1,8 +1,12 @@
 from threading import Thread
+from functools import partial
 
-from utils.download import download
+from utils.download import Downloader
 from utils import get_logger
-from scraper import scraper
+from utils.metrics import metrics
+from utils.urls import parse_url
+from crawler.parse_pool import get_scraper
+from crawler.pages import page_record, unchanged
 import time
 
 
@@ -11,6 +15,8 @@ class Worker(Thread):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
+        self.downloader = Downloader(config, self.logger)
+        self.scraper = get_scraper(config)
         super().__init__(daemon=True)
         
     def run(self):
@@ -19,12 +25,53 @@ class Worker(Thread):
             if not tbd_url:
                 self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            scraped_urls = scraper(tbd_url, resp)
+            crawl_page(
+                self.frontier, self.scraper, tbd_url,
+                partial(self._download, tbd_url), self.logger, self.config)
+            if not getattr(self.frontier, "polite", False):
+                time.sleep(self.config.time_delay)
+        self.downloader.close()
+
+    def _download(self, url):
+        resp = self.downloader.download(url)
+        return resp, self.downloader.last_latency
+
+
+def crawl_page(frontier, scraper, url, fetch, logger, config):
+    ''' Crawls url for either engine: fetch() downloads it and returns its
+        Response and the download's latency in seconds, then the page is
+        scraped and its links added to frontier. Whatever fails, url is
+        marked complete: without a page, so a refresh scrapes it again, and
+        released, or the polite frontier would keep its host busy and every
+        worker waiting on it forever. '''
+    page = status = latency = None
+    try:
+        resp, elapsed = fetch()
+        logger.info(
+            f"Downloaded {url}, status <{resp.status}>, in {elapsed:.3f}s, "
+            f"using cache {config.cache_server}.")
+        if not resp.transport_error:
+            # Only what the host did changes its politeness delay.
+            status, latency = resp.status, elapsed
+        metrics.counter("pages").inc()
+        metrics.counter(f"status.{resp.status}").inc()
+        metrics.counter(f"host.{parse_url(url).netloc}").inc()
+        page = page_record(resp)
+        previous = frontier.previous_page(url)
+        if unchanged(previous, page):
+            # Refreshing a page that hasn't changed: reuse its links.
+            metrics.counter("unchanged").inc()
+            scraped_urls = previous.links
+        else:
+            with metrics.timer("parse"):
+                scraped_urls = scraper(url, resp, revisit=previous is not None)
+        with metrics.timer("frontier_add"):
             for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
-            self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
+                frontier.add_url(scraped_url, url)
+        page = page and page._replace(links=scraped_urls)
+    except Exception:
+        logger.exception(f"Failed to crawl {url}.")
+        page = None
+    finally:
+        with metrics.timer("frontier_complete"):
+            frontier.mark_url_complete(url, page, status, latency)
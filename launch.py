@@ -4,14 +4,27 @@ from argparse import ArgumentParser
 from utils.server_registration import get_cache_server
 from utils.config import Config
 from crawler import Crawler
+from crawler.frontier import FRONTIERS
 
 
-def main(config_file, restart):
+def main(config_file, restart, engine=None, refresh=False):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
+    if engine:
+        config.engine = engine
+    config.refresh = refresh
     config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
+    if config.shards > 1:
+        from crawler.sharded import ShardedCrawler
+        crawler_factory = ShardedCrawler
+    elif config.engine == "async":
+        from crawler.async_crawler import AsyncCrawler
+        crawler_factory = AsyncCrawler
+    else:
+        crawler_factory = Crawler
+    crawler = crawler_factory(
+        config, restart, frontier_factory=FRONTIERS[config.frontier])
     crawler.start()
 
 
@@ -19,5 +32,8 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--engine", choices=["threads", "async"], default=None)
+    parser.add_argument("--refresh", action="store_true", default=False,
+                        help="download every url again, skipping unchanged pages")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(args.config_file, args.restart, args.engine, args.refresh)
@@ -2,15 +2,30 @@
 2. It relies on two files to function properly:
 -urls.txt, a text file that includes a list of all the URLs crawled with
  their respective word counts.
--wordfreqs.pickle, a pickled version of a dictionary of word frequencies
- across all URL web pages. '''
+-wordfreqs/, the word frequency store (see utils/wordfreqs.py) holding
+ word frequencies across all URL web pages.
 
+urls.txt is read in a single streaming pass, and the stats gathered from it
+are saved to report.state along with how far it was read, so running the
+report again (for example while the crawl is still going) only reads the
+lines added since. '''
+
+import os
+import re
+import pickle
+import hashlib
+
+from argparse import ArgumentParser
 from collections import defaultdict
 from urllib.parse import urlparse
-import pickle
+from utils.wordfreqs import WordFreqStore
+from utils.digests import DigestMap, short_digest
 
 URLS_PATH = 'urls.txt'
-WORDFREQS_PATH = 'wordfreqs.pickle'
+WORDFREQS_PATH = 'wordfreqs'
+STATE_PATH = 'report.state'
+# the netloc of a url with a scheme, as urlparse would split it
+NETLOC_PATTERN = re.compile(r'[^:/?#]+://([^/?#]*)')
 
 ''' This is the stopwords set from nltk.corpus, but I
 didn't want to bother with the optics of installing an entire module
@@ -34,62 +49,134 @@ STOPWORDS = {'ourselves', 'hers', 'between', 'yourself', 'but',
              'further', 'was', 'here', 'than'} 
 
 
-def convert_urls_to_dict(path: str) -> dict:
-    ''' Given the path to urls.txt, returns a dictionary
-    where the keys are URL strings and the values are their
-    respective word counts, in integer form. '''
-    urls_dict = dict()
-    with open(path) as urls:
-        for line in urls:
-            url, word_count = line.rstrip().split(' -> ')
-            urls_dict[url] = int(word_count)
-    return urls_dict
+def url_digest(url: str) -> int:
+    ''' The 64 bit digest a url's word count is kept under. '''
+    return short_digest(hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+def parse_line(line: bytes) -> tuple:
+    ''' Splits a line of urls.txt into its url and word count. '''
+    url, word_count = line.decode('utf-8').rstrip().rsplit(' -> ', 1)
+    return url, int(word_count)
+
 
-def num_unique_pages(urls: dict) -> int:
-    ''' Given the dict representing urls.txt, returns the number
-    of unique pages in the dict. '''
-    return len(urls.keys())
+class UrlStats(object):
+    ''' Page counts from urls.txt: the number of unique pages, the page with
+    the most words, and how many unique pages each ICS subdomain has. The
+    last word count of each url is kept in a DigestMap under a 64 bit
+    digest of the url, so memory stays small as urls.txt grows. offset is
+    how many bytes of urls.txt were read, and head the first line read, to
+    tell when urls.txt was replaced. '''
+    def __init__(self):
+        self.offset = 0
+        self.head = None
+        self.pages = 0
+        self.max_url = None
+        self.max_words = -1
+        self.subdomains = defaultdict(int)
+        self.counts = DigestMap()
 
-def url_with_max_words(urls: dict) -> tuple:
-    ''' Given the dict representing urls.txt, returns the key-value
-    pair with the highest word count. '''
-    return max((url for url in urls.items()), key = lambda x: x[1])
+    @classmethod
+    def load(cls, state_path: str) -> 'UrlStats':
+        ''' Returns the stats saved at state_path, or empty stats if there
+        are none. '''
+        stats = cls()
+        if os.path.exists(state_path):
+            with open(state_path, 'rb') as state:
+                stats.__dict__.update(pickle.load(state))
+        return stats
+
+    def save(self, state_path: str):
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'wb') as state:
+            pickle.dump(self.__dict__, state, protocol=4)
+        os.replace(tmp_path, state_path)
+
+    def add(self, url: str, word_count: int) -> bool:
+        ''' Counts one line of urls.txt. A url seen before only counts once,
+        with its last word count, like the keys of a dict. Returns False if
+        this lowered the count of the page with the most words, which then
+        has to be found again. '''
+        digest = url_digest(url)
+        previous = self.counts.get(digest)
+        self.counts.put(digest, word_count)
+        if word_count > self.max_words:
+            self.max_url, self.max_words = url, word_count
+        elif url == self.max_url and word_count < self.max_words:
+            return False
+        if previous is None:
+            self.pages += 1
+            match = NETLOC_PATTERN.match(url)
+            subdomain = match.group(1) if match else urlparse(url).netloc
+            if 'ics.uci.edu' in subdomain:
+                self.subdomains[subdomain] += 1
+        return True
+
+    def _find_max(self, urls):
+        ''' Finds the page with the most words again, among the lines of
+        urls.txt read so far that hold their url's last word count. '''
+        self.max_url, self.max_words = None, -1
+        urls.seek(0)
+        offset = 0
+        for line in urls:
+            if offset >= self.offset:
+                break
+            offset += len(line)
+            url, word_count = parse_line(line)
+            if (word_count > self.max_words
+                    and self.counts.get(url_digest(url)) == word_count):
+                self.max_url, self.max_words = url, word_count
+
+    def update(self, path: str):
+        ''' Reads the lines of urls.txt at path added since the last update.
+        A last line without a newline is still being written and is left
+        for the next update. If urls.txt is a different file from the one
+        these stats were gathered from, it is read from the start. '''
+        with open(path, 'rb') as urls:
+            head = urls.readline()
+            if ((self.head is not None and head != self.head)
+                    or os.path.getsize(path) < self.offset):
+                self.__init__()
+            if self.head is None and head.endswith(b'\n'):
+                self.head = head
+            urls.seek(self.offset)
+            max_lowered = False
+            for line in urls:
+                if not line.endswith(b'\n'):
+                    break
+                self.offset += len(line)
+                if not self.add(*parse_line(line)):
+                    max_lowered = True
+            if max_lowered:
+                self._find_max(urls)
 
 def most_common_words(path: str) -> list:
-    ''' Given the path to the pickled word frequencies dictionary,
-    returns a list of the 50 most common words, excluding stop words. '''
-    with open(path, 'rb') as wordfreqs:
-        word_freqs = pickle.load(wordfreqs)
-    word_freqs = {word: count for word, count in sorted(word_freqs.items(),
-                  key = lambda item: -item[1]) if (word not in STOPWORDS
-                  and not word.isnumeric() and len(word) >= 3)}
-    return list(word_freqs.items())[:50]
-
-def all_ics_subdomains(urls: dict) -> list:
-    ''' Given the dict representing urls.txt, returns a sorted list
+    ''' Given the path to the word frequency store, returns a list of the
+    50 most common words, excluding stop words. '''
+    return WordFreqStore(path).top(50, keep = lambda word: (word not in STOPWORDS
+                                   and not word.isnumeric() and len(word) >= 3))
+
+def all_ics_subdomains(stats: UrlStats) -> list:
+    ''' Given the stats of urls.txt, returns a sorted list
     of 2-tuples with the first item of a tuple being an ICS subdomain
     and the second item being the number of times that subdomain appears
     in urls.txt. '''
-    subdomains = defaultdict(int)
-    for url in urls.keys():
-        subdomain = urlparse(url).netloc
-        if 'ics.uci.edu' in subdomain:
-            subdomains[subdomain] += 1
-    return sorted(subdomains.items())
-
-    
+    return sorted(stats.subdomains.items())
 
 
 if __name__ == '__main__':
-    urls = convert_urls_to_dict(URLS_PATH)
-    print(f"Number of unique pages: {num_unique_pages(urls)}")
-    max_url, max_word_count = url_with_max_words(urls)
-    print(f"Page with most words: {max_url} with {max_word_count} words")
+    parser = ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", default=False,
+                        help=f"ignore {STATE_PATH} and read urls.txt from the start")
+    args = parser.parse_args()
+    stats = UrlStats() if args.rebuild else UrlStats.load(STATE_PATH)
+    stats.update(URLS_PATH)
+    stats.save(STATE_PATH)
+    print(f"Number of unique pages: {stats.pages}")
+    print(f"Page with most words: {stats.max_url} with {stats.max_words} words")
     common_words = most_common_words(WORDFREQS_PATH)
     print("50 most common words: ")
-    for i in range(50):
-        print(f"{i+1}. {common_words[i][0]}, {common_words[i][1]}")
+    for i, (word, count) in enumerate(common_words):
+        print(f"{i+1}. {word}, {count}")
     print("Subdomains:")
-    for subdomain, num_times in all_ics_subdomains(urls):
+    for subdomain, num_times in all_ics_subdomains(stats):
         print(f"{subdomain}, {num_times}")
-    
@@ -1,114 +1,293 @@
 import re
 from urllib.parse import urlparse
 import urllib
-from bs4 import BeautifulSoup
-from collections import defaultdict
-import pickle
-import os.path
+from html.parser import HTMLParser
+from collections import Counter, namedtuple
+from functools import lru_cache
+from utils import get_urlhash
+from utils.wordfreqs import WordFreqStore
+from utils.urls import parse_url, DomainMatcher, URL_CACHE_SIZE
+from utils.simhash import simhash, SimHashIndex
 
-def scraper(url, resp):
-    links = extract_next_links(url, resp)
+WORDFREQS_DIR = 'wordfreqs'
+# word frequencies are counted in memory and saved to WORDFREQS_DIR in the
+# background; a wordfreqs.pickle from older crawls is folded in on first merge
+word_freqs = WordFreqStore(WORDFREQS_DIR, legacy_path='wordfreqs.pickle')
+# SimHash fingerprints of recorded pages, set by open_fingerprints; while it's
+# None pages aren't checked for near-duplicates
+fingerprints = None
+
+def open_fingerprints(config, from_seeds):
+    ''' Opens the fingerprint index saved next to the frontier save file,
+        starting a new one if the frontier started from the seeds. '''
+    global fingerprints
+    path = f"{config.save_file}.simhash"
+    if from_seeds:
+        SimHashIndex.remove(path)
+    fingerprints = SimHashIndex(path, config.simhash_distance)
+
+def scraper(url, resp, extractor='bs4', revisit=False):
+    links = extract_next_links(url, resp, extractor, revisit)
     return [link for link in links if is_valid(link)]
 
-def extract_next_links(url, resp):
+def extract_next_links(url, resp, extractor='bs4', revisit=False):
+    url = crawlable_url(url, resp)
+    if url is None:
+        # if the URL is not safe to crawl, don't extract any links from it
+        return []
+    page = parse_page(url, resp.raw_response.content, extractor)
+    return record_page(url, page, revisit)
+
+def crawlable_url(url, resp):
+    ''' Returns the URL the page should be recorded under, or None if the
+        page shouldn't be crawled. '''
     # safe_to_crawl is a large boolean expression that determines
     # whether we should crawl a link. It checks for the following:
+    # the response status is successful (200-299), checked first so error
+    # pages are never unpickled
     # there is actually a raw_response (handles 404 and similar errors)
     # the site has 'content-type' in its headers
     # the site is in a text format
     # the site does not redirect anywhere invalid (could be a malicious redirect)
-    # the response status is successful (200-299)
-    safe_to_crawl = (resp.raw_response and 'content-type' in resp.raw_response.headers
+    safe_to_crawl = (200 <= resp.status <= 299 and resp.raw_response
+                     and 'content-type' in resp.raw_response.headers
                      and resp.raw_response.headers['Content-Type'].startswith('text')
-                     and is_valid(resp.raw_response.url) and 200 <= resp.status <= 299)
-    if safe_to_crawl:
-        if missing_slash(url, resp.raw_response.url):
-            url = url + '/'
-        soup = BeautifulSoup(resp.raw_response.content, 'html.parser')
+                     and is_valid(resp.raw_response.url))
+    if not safe_to_crawl:
+        return None
+    if missing_slash(url, resp.raw_response.url):
+        url = url + '/'
+    return url
+
+# links are the page's outlinks (not yet checked with is_valid), text_length
+# is the length of its visible text, word_counts its token frequencies and
+# fingerprint the SimHash of those; word_counts and fingerprint are None for
+# pages with low informational content
+ParsedPage = namedtuple('ParsedPage', ['links', 'text_length', 'word_counts', 'fingerprint'])
+
+def parse_page(url: str, content: bytes, extractor: str = 'bs4') -> ParsedPage:
+    ''' Given a page's URL and html content, extracts its links and counts
+        its words. Has no side effects, so it can run in another process.
+        extractor is 'bs4' to build a BeautifulSoup tree, or 'fast' to make
+        a single pass with LinkTextExtractor, which finds the same links. '''
+    # imported here so that loading the frontier doesn't wait on bs4
+    from bs4 import BeautifulSoup, UnicodeDammit
+    if extractor == 'fast':
+        parser = LinkTextExtractor()
+        parser.feed(UnicodeDammit(content, is_html=True).unicode_markup or '')
+        parser.close()
+        hrefs, text_length = parser.hrefs, parser.text_length
+        get_text = parser.get_text
+    else:
+        soup = BeautifulSoup(content, 'html.parser')
         text = soup.get_text()
-        next_links = []
-        # ignore pages with low informational content (based on text)
-        if len(text)/len(resp.raw_response.content) > .06 and len(text) >= 1000:
-            num_words = count_words(text)
-            with open('urls.txt', 'a') as urls:
-                urls.write(f"{url} -> {num_words}\n")
-            for link in soup.find_all('a'):
-                # defrag it and address URL encoding
-                link = link.get('href')
-                if link != None:
-                    link = re.sub(r'%7e', '~', link, flags = re.IGNORECASE)
-                    link = urllib.parse.urldefrag(link).url
-                    parsed_link = urlparse(link)
-                    # if the link has a netloc, it's a direct link
-                    if parsed_link.netloc:
-                        # if it starts with '//', it needs scheme added
-                        if link.startswith('//'):
-                            link_to_append = 'https:' + link
-                        else:
-                            link_to_append = link
-                    # if there's an '@' in the link, it's an e-mail, so ignore it
-                    elif '@' in link:
-                        link_to_append = url # better than an empty string
-                    # otherwise, it's a relative link (a path)
-                    else:
-                        url_path = parsed_link.path
-                        # if the path starts with a '/', it's relative to the main domain
-                        if url_path.startswith('/'):
-                            parsedurl = urlparse(url)
-                            link_to_append = urllib.parse.urljoin(parsedurl.scheme + '://' + parsedurl.netloc,
-                                                                  url_path)
-                        # if not, path is relative to the full URL, so add it to end
-                        else:
-                            link_to_append = urllib.parse.urljoin(url, url_path)
-                    # strip link of whitespace (can sometimes cause EOFError in download.py)        
-                    next_links.append(link_to_append.strip())
-                
-        return next_links
-    # if the URL is not safe to crawl, don't extract any links from it
-    return []
+        hrefs = (link.get('href') for link in soup.find_all('a'))
+        text_length = len(text)
+        get_text = lambda: text
+    # ignore pages with low informational content (based on text)
+    if not (content and text_length/len(content) > .06 and text_length >= 1000):
+        return ParsedPage([], text_length, None, None)
+    next_links = []
+    for link in hrefs:
+        if link != None:
+            next_links.append(resolve_link(url, link))
+    word_counts = tokenize(get_text())
+    return ParsedPage(next_links, text_length, word_counts, simhash(word_counts))
+
+class LinkTextExtractor(HTMLParser):
+    ''' Collects the hrefs of a page's <a> tags and its visible text in one
+        pass, without building a tree. Counts text the same way as
+        BeautifulSoup's get_text() with html.parser: strings inside script,
+        style, template, rt and rp tags, comments, doctypes and processing
+        instructions are left out, CDATA sections are kept, and strings that
+        are only whitespace become a single space or newline outside of pre
+        and textarea tags. '''
+    HIDDEN_TAGS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+    PRESERVE_TAGS = frozenset(['pre', 'textarea'])
+    # tags BeautifulSoup closes as soon as they are opened
+    VOID_TAGS = frozenset([
+        'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen',
+        'link', 'menuitem', 'meta', 'param', 'source', 'track', 'wbr',
+        'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+        'nextid', 'spacer'])
+    ASCII_SPACES = ' \n\t\x0c\r'
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs = []
+        self.text = []
+        self.text_length = 0
+        # data since the last tag, which makes up one string
+        self.data = []
+        # names of the open tags, and how many of them hide their text or
+        # preserve its whitespace
+        self.open_tags = []
+        self.hidden = 0
+        self.preserving = 0
+
+    def end_data(self):
+        if not self.data:
+            return
+        data = ''.join(self.data)
+        self.data.clear()
+        if self.hidden:
+            return
+        if not self.preserving and not data.strip(self.ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+        self.text.append(data)
+        self.text_length += len(data)
+
+    def handle_starttag(self, tag, attrs):
+        self.end_data()
+        if tag == 'a':
+            href = None
+            # like BeautifulSoup, the last duplicate attribute wins and an
+            # attribute without a value is the empty string
+            for name, value in attrs:
+                if name == 'href':
+                    href = value if value is not None else ''
+            self.hrefs.append(href)
+        if tag not in self.VOID_TAGS:
+            self.open_tags.append(tag)
+            self.hidden += tag in self.HIDDEN_TAGS
+            self.preserving += tag in self.PRESERVE_TAGS
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        self.end_data()
+        # close everything up to the most recent open tag with this name
+        for i in range(len(self.open_tags) - 1, -1, -1):
+            if self.open_tags[i] == tag:
+                for closed in self.open_tags[i:]:
+                    self.hidden -= closed in self.HIDDEN_TAGS
+                    self.preserving -= closed in self.PRESERVE_TAGS
+                del self.open_tags[i:]
+                break
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_comment(self, data):
+        self.end_data()
+
+    def handle_decl(self, decl):
+        self.end_data()
+
+    def handle_pi(self, data):
+        self.end_data()
+
+    def unknown_decl(self, data):
+        self.end_data()
+        if data.upper().startswith('CDATA['):
+            self.data.append(data[len('CDATA['):])
+            # CDATA is its own string, and isn't hidden by its container
+            hidden, self.hidden = self.hidden, 0
+            self.end_data()
+            self.hidden = hidden
+
+    def close(self):
+        super().close()
+        self.end_data()
+
+    def get_text(self) -> str:
+        return ''.join(self.text)
+
+def resolve_link(url: str, link: str) -> str:
+    ''' Given the URL of a page and the href of a link on it, returns the
+        absolute URL the link points to. '''
+    # defrag it and address URL encoding
+    link = re.sub(r'%7e', '~', link, flags = re.IGNORECASE)
+    link = urllib.parse.urldefrag(link).url
+    parsed_link = urlparse(link)
+    # if the link has a netloc, it's a direct link
+    if parsed_link.netloc:
+        # if it starts with '//', it needs scheme added
+        if link.startswith('//'):
+            link_to_append = 'https:' + link
+        else:
+            link_to_append = link
+    # if there's an '@' in the link, it's an e-mail, so ignore it
+    elif '@' in link:
+        link_to_append = url # better than an empty string
+    # otherwise, it's a relative link (a path)
+    else:
+        url_path = parsed_link.path
+        # if the path starts with a '/', it's relative to the main domain
+        if url_path.startswith('/'):
+            parsedurl = parse_url(url)
+            link_to_append = urllib.parse.urljoin(parsedurl.scheme + '://' + parsedurl.netloc,
+                                                  url_path)
+        # if not, path is relative to the full URL, so add it to end
+        else:
+            link_to_append = urllib.parse.urljoin(url, url_path)
+    # strip link of whitespace (can sometimes cause EOFError in download.py)
+    return link_to_append.strip()
+
+def record_page(url: str, page: ParsedPage, revisit: bool = False) -> list:
+    ''' Given a parsed page, adds its words to our stored word frequencies,
+        records it in urls.txt and returns its links. Pages that are
+        near-duplicates of one already recorded (calendars, wiki revisions,
+        mirrors) are dropped like low information pages, unless revisit is
+        set. A page is never a near-duplicate of its own url's fingerprint,
+        so one downloaded again after a crash keeps its links. '''
+    if page.word_counts is None:
+        return []
+    # the url's key in the fingerprint index; 0 means unknown there
+    owner = int(get_urlhash(url.rstrip('/'))[:16], 16) or 1
+    if (fingerprints is not None
+            and not fingerprints.add_if_new(page.fingerprint, owner)
+            and not revisit):
+        return []
+    num_words = sum(page.word_counts.values())
+    word_freqs.add(page.word_counts)
+    with open('urls.txt', 'a') as urls:
+        urls.write(f"{url} -> {num_words}\n")
+    return page.links
+
+def tokenize(text: str) -> Counter:
+    ''' Given a string of text, returns the frequency of each word in it (word
+        being defined by the tokenizer). '''
+    return Counter(word.lower() for word in re.findall(r'[a-zA-Z0-9]+', text))
 
 def count_words(text: str) -> int:
     ''' Given a string of text, counts the amount of words in the text (word being
-        defined by the tokenizer) and modifies our stored word frequencies. '''
-    # if we don't have an existing pickle file, create it
-    if not os.path.exists('wordfreqs.pickle'):
-        with open('wordfreqs.pickle', 'wb') as wordfreqs:
-            pickle.dump(defaultdict(int), wordfreqs, protocol=4)
-    
-    word_count = 0
-    with open('wordfreqs.pickle', 'rb') as wordfreqs:
-        word_freqs = pickle.load(wordfreqs)
-    for word in re.findall(r'[a-zA-Z0-9]+', text):
-        word = word.lower()
-        word_count += 1
-        word_freqs[word] += 1
-    with open('wordfreqs.pickle', 'wb') as wordfreqs:
-        pickle.dump(word_freqs, wordfreqs, protocol=4)
-    return word_count
+        defined by the tokenizer) and adds them to our stored word frequencies. '''
+    counts = tokenize(text)
+    word_freqs.add(counts)
+    return sum(counts.values())
 
 def missing_slash(url: str, resp_url: str) -> bool:
     # checks whether the url is missing a slash when it should have one
-    parsed1 = urlparse(url)
-    parsed2 = urlparse(resp_url)
+    parsed1 = parse_url(url)
+    parsed2 = parse_url(resp_url)
     if parsed1.netloc == parsed2.netloc and parsed1.path + '/' == parsed2.path:
         return True
     return False
     
 
+VALID_SCHEMES = frozenset(["http", "https"])
+VALID_DOMAINS = DomainMatcher(['today.uci.edu', '.ics.uci.edu', '.cs.uci.edu', '.informatics.uci.edu', '.stat.uci.edu'])
+# paths that end with a file extension, and the extensions we can read
+EXTENSION_PATTERN = re.compile(r"\/*\.[^\.\/]*$")
+VALID_EXTENSION_PATTERN = re.compile(r".*\.(htm|html|php|txt)$")
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
 def is_valid(url):
     try:
-        parsed = urlparse(url)
+        parsed = parse_url(url)
 
-        if parsed.scheme not in set(["http", "https"]):
+        if parsed.scheme not in VALID_SCHEMES:
             return False
 
-        valid_domains = ['today.uci.edu', '.ics.uci.edu', '.cs.uci.edu', '.informatics.uci.edu', '.stat.uci.edu']
-
-        # if the url's domain doesn't include any of these valid domains
-        if not any(domain in parsed.netloc for domain in valid_domains):
+        # if the url's host isn't under any of the valid domains
+        domain = VALID_DOMAINS.match(parsed.host)
+        if domain is None:
             return False
 
-        if ('today.uci.edu' in parsed.netloc and 'department/information_computer_sciences' not in parsed.path):
+        if (domain == 'today.uci.edu' and 'department/information_computer_sciences' not in parsed.path):
             return False
 
         # infinite trap checker: split the path by slashes and put into a set
@@ -127,12 +306,12 @@ def is_valid(url):
         if 'replytocom' in parsed.query: return False
 
         # if the URL ends with an extension, check to make sure it's a valid file-type to read
-        if re.search(r"\/*\.[^\.\/]*$", parsed.path.lower()):
-            return re.match(
-                r".*\.(htm|html|php|txt)$", parsed.path.lower())
+        path = parsed.path.lower()
+        if EXTENSION_PATTERN.search(path):
+            return VALID_EXTENSION_PATTERN.match(path) is not None
             
         return True
 
     except TypeError:
-        print ("TypeError for ", parsed)
+        print ("TypeError for ", url)
         raise
@@ -0,0 +1,48 @@
+import random
+
+from utils.digests import DigestMap
+
+
+def check(table, expected):
+    assert len(table) == len(expected)
+    assert dict(table.items()) == expected
+    for digest, value in expected.items():
+        assert table.get(digest) == value
+
+
+def test_digest_map_pop_matches_dict():
+    rng = random.Random(14)
+    table = DigestMap(capacity=4)
+    expected = dict()
+    # Few distinct low bits, so long probe runs wrap around the table and
+    # pops have entries to shift back.
+    digests = [
+        rng.getrandbits(48) << 16 | rng.randrange(1, 8) for _ in range(300)]
+    for step in range(5000):
+        digest = rng.choice(digests)
+        if rng.random() < 0.45:
+            assert table.pop(digest) == expected.pop(digest, None)
+        else:
+            value = rng.getrandbits(64)
+            table.put(digest, value)
+            expected[digest] = value
+        if step % 250 == 0:
+            check(table, expected)
+    check(table, expected)
+    for digest in list(expected):
+        assert table.pop(digest) == expected.pop(digest)
+    check(table, expected)
+    assert table.pop(digests[0]) is None
+
+
+def test_digest_map_pop_wrapping_run():
+    table = DigestMap(capacity=4)
+    size = table.mask + 1
+    # All homed in the last slot, so the run wraps to the start.
+    last = [size - 1 + size * i for i in range(1, 6)]
+    for value, digest in enumerate(last):
+        table.put(digest, value)
+    assert table.pop(last[1]) == 1
+    assert table.pop(last[0]) == 0
+    check(table, {digest: value for value, digest in enumerate(last)
+                  if value > 1})
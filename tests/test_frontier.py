@@ -0,0 +1,126 @@
+import math
+import time
+from threading import Thread
+from types import SimpleNamespace
+
+import pytest
+
+import crawler.frontier
+from crawler.frontier import PoliteFrontier
+
+
+@pytest.fixture(autouse=True)
+def logs_in_tmp_path(tmp_path, monkeypatch):
+    # The frontier logs to Logs/ under the working directory.
+    monkeypatch.chdir(tmp_path)
+
+
+def make_config(tmp_path, seed_urls, time_delay=0.5):
+    return SimpleNamespace(
+        save_file=str(tmp_path / "frontier.log"), store="log",
+        priority="depth", seed_urls=seed_urls, refresh=False,
+        commit_batch=512, commit_interval=0.2, bloom_capacity=10000,
+        bloom_error=0.001, time_delay=time_delay, max_time_delay=60,
+        park_after=3, park_time=300)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def start_get(frontier):
+    ''' Calls get_tbd_url on a thread; its result goes in the returned
+        list. '''
+    result = []
+    thread = Thread(target=lambda: result.append(frontier.get_tbd_url()),
+                    daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_one_worker_per_host_and_next_request(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(crawler.frontier, "time", clock)
+    a = ["https://a.ics.uci.edu/1", "https://a.ics.uci.edu/2"]
+    b = ["https://b.ics.uci.edu/1"]
+    frontier = PoliteFrontier(make_config(tmp_path, a + b), True)
+
+    first, _ = frontier.poll_tbd_url()
+    second, _ = frontier.poll_tbd_url()
+    assert {first, second} == {a[0], b[0]}
+    # a's second url waits while its first is out with a worker.
+    assert frontier.poll_tbd_url() == (None, math.inf)
+
+    frontier.mark_url_complete(a[0], status=200, latency=0.01)
+    assert frontier.poll_tbd_url() == (None, 0.5)
+    clock.now += 0.4
+    assert frontier.poll_tbd_url()[0] is None
+    clock.now += 0.1
+    assert frontier.poll_tbd_url() == (a[1], 0)
+    # A slower host is left alone for longer.
+    frontier.mark_url_complete(a[1], status=200, latency=0.01)
+    frontier.mark_url_complete(b[0], status=503, latency=0.01)
+    assert frontier.poll_tbd_url() == (None, None)
+    assert frontier.next_request[frontier.host_ids["b.ics.uci.edu"]] > (
+        frontier.next_request[frontier.host_ids["a.ics.uci.edu"]])
+    frontier.close()
+
+
+def test_get_tbd_url_blocks_until_host_is_ready(tmp_path):
+    urls = ["https://a.ics.uci.edu/1", "https://a.ics.uci.edu/2"]
+    frontier = PoliteFrontier(make_config(tmp_path, urls, 0.1), True)
+    assert frontier.get_tbd_url() == urls[0]
+
+    thread, result = start_get(frontier)
+    time.sleep(0.1)
+    assert result == []
+    frontier.mark_url_complete(urls[0], status=200, latency=0.01)
+    completed = time.time()
+    thread.join(5)
+    assert result == [urls[1]]
+    assert time.time() - completed >= 0.09
+    frontier.mark_url_complete(urls[1], status=200, latency=0.01)
+    assert frontier.get_tbd_url() is None
+    frontier.close()
+
+
+def test_get_tbd_url_returns_none_only_when_nothing_is_left(tmp_path):
+    urls = ["https://a.ics.uci.edu/1"]
+    frontier = PoliteFrontier(make_config(tmp_path, urls, 0), True)
+    assert frontier.get_tbd_url() == urls[0]
+
+    # Out with a worker, whose page may still add urls.
+    thread, result = start_get(frontier)
+    time.sleep(0.1)
+    assert result == []
+    frontier.add_url("https://b.ics.uci.edu/1", parent=urls[0])
+    thread.join(5)
+    assert result == ["https://b.ics.uci.edu/1"]
+
+    # Both busy, and the save file still loading.
+    with frontier.lock:
+        frontier.loading = True
+    frontier.mark_url_complete(urls[0], status=200, latency=0.01)
+    frontier.mark_url_complete(result[0], status=200, latency=0.01)
+    thread, result = start_get(frontier)
+    time.sleep(0.1)
+    assert result == []
+    frontier._load(iter([("https://c.ics.uci.edu/1", 0)]))
+    thread.join(5)
+    assert result == ["https://c.ics.uci.edu/1"]
+
+    thread, result = start_get(frontier)
+    time.sleep(0.1)
+    assert result == []
+    with frontier.lock:
+        frontier.loading = False
+        frontier.lock.notify_all()
+    frontier.mark_url_complete(
+        "https://c.ics.uci.edu/1", status=200, latency=0.01)
+    thread.join(5)
+    assert result == [None]
+    frontier.close()
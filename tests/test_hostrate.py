@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+from crawler.hostrate import RateControl
+
+
+def make_rates():
+    return RateControl(SimpleNamespace(
+        time_delay=0.5, max_time_delay=60, park_after=3, park_time=300))
+
+
+def test_host_failures_back_off_and_park():
+    rates = make_rates()
+    assert rates.update("host", 200, 0.1) == 0.5
+    assert rates.update("host", 503, 0.1) == 1.0
+    assert rates.update("host", 601, 0.1) == 2.0
+    assert rates.update("host", 408, 0.1) == 300
+    assert rates.update("host", 200, 0.1) == 3.75
+
+
+def test_cache_server_statuses_leave_the_host_alone():
+    rates = make_rates()
+    rates.update("host", 503, 0.1)
+    # A url the cache server rejected, and a failure to reach it at all.
+    assert rates.update("host", 604, 30.0) == 1.0
+    assert rates.update("host", None, None) == 1.0
+    assert rates.hosts["host"].failures == 1
+    assert rates.hosts["host"].latency == 0.1
@@ -0,0 +1,29 @@
+from report import UrlStats
+
+
+def write_lines(path, lines):
+    with open(path, "a") as urls:
+        for url, word_count in lines:
+            urls.write(f"{url} -> {word_count}\n")
+
+
+def test_last_word_count_of_a_url_wins(tmp_path):
+    path = str(tmp_path / "urls.txt")
+    write_lines(path, [("https://a.ics.uci.edu/1", 10),
+                       ("https://a.ics.uci.edu/2", 50),
+                       ("https://b.ics.uci.edu/3", 30)])
+    stats = UrlStats()
+    stats.update(path)
+    assert (stats.max_url, stats.max_words) == ("https://a.ics.uci.edu/2", 50)
+
+    # Pages changed on a --refresh crawl are written again.
+    write_lines(path, [("https://a.ics.uci.edu/2", 5),
+                       ("https://a.ics.uci.edu/1", 20)])
+    stats.update(path)
+    assert stats.pages == 3
+    assert dict(stats.subdomains) == {"a.ics.uci.edu": 2, "b.ics.uci.edu": 1}
+    assert (stats.max_url, stats.max_words) == ("https://b.ics.uci.edu/3", 30)
+
+    write_lines(path, [("https://a.ics.uci.edu/1", 40)])
+    stats.update(path)
+    assert (stats.max_url, stats.max_words) == ("https://a.ics.uci.edu/1", 40)
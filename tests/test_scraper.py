@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from scraper import parse_page
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), "pages")
+PAGES = sorted(name for name in os.listdir(PAGES_DIR) if name.endswith(".html"))
+PAGE_URL = "https://www.ics.uci.edu/dept/page.html"
+
+
+def read_page(name):
+    with open(os.path.join(PAGES_DIR, name), "rb") as page:
+        return page.read()
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_fast_extractor_matches_bs4(name):
+    content = read_page(name)
+    fast = parse_page(PAGE_URL, content, "fast")
+    bs4 = parse_page(PAGE_URL, content, "bs4")
+    assert fast.links == bs4.links
+    assert fast.text_length == bs4.text_length
+    assert fast.word_counts == bs4.word_counts
+    assert fast.fingerprint == bs4.fingerprint
+
+
+def test_pages_are_parsed():
+    ''' Every page but short.html has enough text to have its links and
+        words counted, so the comparison above covers them. '''
+    for name in PAGES:
+        page = parse_page(PAGE_URL, read_page(name), "fast")
+        assert (page.word_counts is None) == (name == "short.html")
+        assert bool(page.links) == (name != "short.html")
@@ -0,0 +1,94 @@
+import time
+import multiprocessing
+from queue import Queue
+from threading import Thread, Lock
+from types import SimpleNamespace
+
+import pytest
+
+from crawler.frontier import Frontier, PoliteFrontier
+from crawler.sharded import ShardCoordinator, shard_frontier, shard_of
+from crawler.store import LogStore
+
+C = "https://c.ics.uci.edu"
+A = "https://a.ics.uci.edu"
+# Each page's links. c's pages are crawled by shard 0 and a's by shard 1.
+LINKS = {
+    f"{C}/1": [f"{C}/2", f"{A}/1"],
+    f"{C}/2": [],
+    f"{A}/1": [f"{C}/3", f"{A}/2"],
+    f"{A}/2": [],
+    f"{C}/3": [f"{A}/3"],
+    f"{A}/3": [],
+}
+
+
+@pytest.fixture(autouse=True)
+def logs_in_tmp_path(tmp_path, monkeypatch):
+    # The frontier logs to Logs/ under the working directory.
+    monkeypatch.chdir(tmp_path)
+
+
+def make_config(tmp_path, shard):
+    return SimpleNamespace(
+        save_file=str(tmp_path / f"frontier.log.shard{shard}"), store="log",
+        priority="depth", seed_urls=[f"{C}/1"] if shard == 0 else [],
+        refresh=False, commit_batch=512, commit_interval=0.2,
+        bloom_capacity=10000, bloom_error=0.001, time_delay=0,
+        max_time_delay=60, park_after=3, park_time=300, engine="threads",
+        threads_count=2)
+
+
+@pytest.mark.parametrize("frontier_factory", [Frontier, PoliteFrontier])
+def test_two_shards_end_after_batches_and_acks(tmp_path, frontier_factory):
+    assert shard_of(C, 2) == 0 and shard_of(A, 2) == 1
+    inboxes = [Queue(), Queue()]
+    coordinator = ShardCoordinator(2, multiprocessing.get_context("spawn"))
+    frontier_class = shard_frontier(frontier_factory)
+    frontiers = [
+        frontier_class(make_config(tmp_path, shard), True, shard=shard,
+                       inboxes=inboxes, coordinator=coordinator)
+        for shard in range(2)]
+    lock = Lock()
+    crawled = []
+    # How many pages were crawled when each worker was told to stop.
+    stopped = []
+
+    def work(frontier):
+        while True:
+            url = frontier.get_tbd_url()
+            if url is None:
+                with lock:
+                    stopped.append(len(crawled))
+                return
+            if url == f"{C}/1":
+                # The shard's other worker runs out of urls meanwhile, and
+                # must wait for these links.
+                time.sleep(0.3)
+            for link in LINKS[url]:
+                frontier.add_url(link, parent=url)
+            with lock:
+                crawled.append(url)
+            frontier.mark_url_complete(url, status=200, latency=0.01)
+
+    workers = [
+        Thread(target=work, args=(frontier,), daemon=True)
+        for frontier in frontiers for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+    assert not any(worker.is_alive() for worker in workers)
+    assert sorted(crawled) == sorted(LINKS)
+    assert stopped == [len(LINKS)] * 4
+    assert coordinator.in_transit.value == 0
+    for frontier in frontiers:
+        frontier.close()
+
+    # Every url sent to the other shard was acknowledged, so none is sent
+    # again on a resume.
+    for shard in range(2):
+        store = LogStore(make_config(tmp_path, shard).save_file,
+                         make_config(tmp_path, shard))
+        assert list(store.pending()) == []
+        store.close()
@@ -0,0 +1,194 @@
+import os
+import time
+
+from types import SimpleNamespace
+
+import pytest
+
+from crawler.pages import PageRecord
+from crawler.store import LogStore
+from utils import get_urlhash
+
+
+def make_config(**options):
+    config = SimpleNamespace(
+        commit_batch=512, commit_interval=0.2, refresh=False)
+    config.__dict__.update(options)
+    return config
+
+
+def url(i):
+    return f"https://www.ics.uci.edu/page{i}"
+
+
+def wait_compacted(store, records):
+    ''' Waits for the flusher thread to compact the log below records. '''
+    deadline = time.time() + 10
+    while store.records >= records and time.time() < deadline:
+        time.sleep(0.01)
+    assert store.records < records
+
+
+def fill(path, count, completed=()):
+    ''' Writes a log with count urls, of which those in completed are
+        downloaded, and returns its size. '''
+    store = LogStore(path, make_config())
+    for i in range(count):
+        store.add(get_urlhash(url(i)), url(i), depth=1)
+    for i in completed:
+        store.complete(get_urlhash(url(i)), url(i), depth=1)
+    store.close()
+    return os.path.getsize(path)
+
+
+@pytest.mark.parametrize("checkpoint", [True, False])
+@pytest.mark.parametrize("torn", ["record", "newline"])
+def test_replay_drops_truncated_last_line(tmp_path, checkpoint, torn):
+    path = str(tmp_path / "frontier.log")
+    size = fill(path, 5, completed=[0, 3])
+    if not checkpoint:
+        os.remove(f"{path}.index")
+    record = b'["%s", "%s", true, 1, null]' % (
+        get_urlhash(url(1)).encode(), url(1).encode())
+    with open(path, "ab") as log:
+        # Cut in the middle, or only missing its newline so it still parses.
+        log.write(record[:-8] if torn == "record" else record)
+
+    store = LogStore(path, make_config())
+    assert os.path.getsize(path) == size
+    assert len(store) == 5
+    assert sorted(store.pending()) == [(url(i), 1) for i in (1, 2, 4)]
+    # Records appended after the torn one was dropped are read back.
+    store.complete(get_urlhash(url(1)), url(1), depth=1)
+    store.close()
+    store = LogStore(path, make_config())
+    assert sorted(store.pending()) == [(url(i), 1) for i in (2, 4)]
+    store.close()
+
+
+def test_checkpoint_older_than_log_replays_the_rest(tmp_path):
+    path = str(tmp_path / "frontier.log")
+    fill(path, 5)
+    with open(f"{path}.index", "rb") as index:
+        old_checkpoint = index.read()
+    store = LogStore(path, make_config())
+    for i in range(5, 8):
+        store.add(get_urlhash(url(i)), url(i), depth=1)
+    store.complete(get_urlhash(url(0)), url(0), depth=1)
+    store.close()
+    with open(f"{path}.index", "wb") as index:
+        index.write(old_checkpoint)
+
+    store = LogStore(path, make_config())
+    assert len(store) == 8
+    assert sorted(store.pending()) == sorted(
+        (url(i), 1) for i in range(1, 8))
+    store.close()
+
+
+@pytest.mark.parametrize("change", ["replaced", "shortened"])
+def test_checkpoint_of_another_log_is_ignored(tmp_path, change):
+    path = str(tmp_path / "frontier.log")
+    other = str(tmp_path / "other.log")
+    if change == "replaced":
+        # A longer log moved into place, as a compaction does.
+        fill(path, 4, completed=[1])
+        fill(other, 20, completed=range(10))
+    else:
+        # A shorter log written over the same file.
+        fill(path, 20, completed=range(10))
+        fill(other, 4, completed=[1])
+    with open(f"{path}.index", "rb") as index:
+        old_checkpoint = index.read()
+    if change == "replaced":
+        os.replace(other, path)
+    else:
+        with open(other, "rb") as source, open(path, "wb") as log:
+            log.write(source.read())
+    with open(f"{path}.index", "wb") as index:
+        index.write(old_checkpoint)
+
+    store = LogStore(path, make_config())
+    if change == "replaced":
+        assert len(store) == 20
+        assert sorted(store.pending()) == sorted(
+            (url(i), 1) for i in range(10, 20))
+    else:
+        assert len(store) == 4
+        assert sorted(store.pending()) == [(url(i), 1) for i in (0, 2, 3)]
+    store.close()
+
+
+def test_compaction_while_pending_is_read(tmp_path):
+    path = str(tmp_path / "frontier.log")
+    fill(path, 100, completed=range(50))
+    store = LogStore(path, make_config())
+    pending = store.pending()
+    first = next(pending)
+    # Enough completed records to compact on the next commit.
+    store.COMPACT_MIN_RECORDS = 0
+    for i in range(50, 90):
+        store.complete(get_urlhash(url(i)), url(i), depth=1)
+    records = store.records
+    store.sync()
+    wait_compacted(store, records)
+
+    # The urls pending when reading started, read from the old log.
+    assert sorted([first] + list(pending)) == sorted(
+        (url(i), 1) for i in range(50, 100))
+    assert sorted(store.pending()) == sorted(
+        (url(i), 1) for i in range(90, 100))
+    store.close()
+    store = LogStore(path, make_config())
+    assert sorted(store.pending()) == sorted(
+        (url(i), 1) for i in range(90, 100))
+    store.close()
+
+
+def test_compaction_keeps_records_written_meanwhile(tmp_path):
+    path = str(tmp_path / "frontier.log")
+    config = make_config(refresh=True)
+
+    def write(store, start, stop):
+        for i in range(start, stop):
+            store.add(get_urlhash(url(i)), url(i), depth=1)
+            if i % 3:
+                page = PageRecord(None, None, f"v{i}", [url(i + 1)])
+                store.complete(get_urlhash(url(i)), url(i), 1, page)
+            if i % 5 == 0:
+                store.complete(get_urlhash(url(i)), url(i), 1,
+                               PageRecord(None, None, "again", []))
+
+    class WritingStore(LogStore):
+        def _records(self, end=None):
+            if end is not None and not self.wrote:
+                # Committed while the old log is being rewritten.
+                self.wrote = True
+                write(self, 200, 400)
+                self.complete(get_urlhash(url(3)), url(3), 1,
+                              PageRecord(None, None, "late", []))
+                self.add(get_urlhash(url(6)), url(6), depth=2)
+                self.sync()
+            return super()._records(end)
+
+    store = WritingStore(path, config)
+    store.wrote = False
+    write(store, 0, 200)
+    store.sync()
+    store._compact()
+    assert store.wrote
+
+    def check(store):
+        assert len(store) == 400
+        assert sorted(store.pending()) == sorted(
+            (url(i), 1) for i in range(4, 400) if i % 3 == 0 and i % 5)
+        for i in (1, 5, 10, 199, 202, 390, 395):
+            expected = "again" if i % 5 == 0 else f"v{i}"
+            assert store.page(get_urlhash(url(i))).digest == expected
+        assert store.page(get_urlhash(url(3))).digest == "late"
+
+    check(store)
+    store.close()
+    store = LogStore(path, config)
+    check(store)
+    store.close()
@@ -0,0 +1,37 @@
+import random
+
+from crawler.urlqueue import HostQueue, IntHeap
+
+
+def test_int_heap_pops_in_order():
+    rng = random.Random(14)
+    items = [rng.getrandbits(60) for _ in range(500)]
+    heap = IntHeap(items[:100])
+    for item in items[100:]:
+        heap.push(item)
+    assert [heap.pop() for _ in items] == sorted(items)
+
+
+def test_host_queue_url_after_compact():
+    prefix = "https://www.ics.uci.edu"
+    queue = HostQueue(prefix)
+    urls = [f"{prefix}/~user/papers/{i // 7}/page{i}.html" for i in range(100)]
+    # Another scheme and port, stored whole.
+    urls[37] = "http://www.ics.uci.edu:8080/other"
+    slots = [queue.append(url, i % 5, i, i, i) for i, url in enumerate(urls)]
+    queue.inlinks[slots[90]] = 3
+    taken = {queue.pop() for _ in range(60)}
+    live = [(urls[i], i) for i in range(len(urls)) if slots[i] not in taken]
+
+    queue.compact()
+    assert len(queue) == len(live) == len(queue.live)
+    assert [queue.url(slot) for slot in range(len(queue))] == [
+        url for url, _ in live]
+    assert [queue.depths[slot] for slot in range(len(queue))] == [
+        i % 5 for _, i in live]
+    assert queue.inlinks[[i for _, i in live].index(90)] == 3
+    # Still ordered by key, and appending after a compact still decodes.
+    slot = queue.append(f"{prefix}/new", 0, 0, 0, 1000)
+    assert queue.url(slot) == f"{prefix}/new"
+    assert [queue.url(queue.pop()) for _ in range(len(live) + 1)] == [
+        url for url, _ in live] + [f"{prefix}/new"]
@@ -0,0 +1,37 @@
+import os
+
+from utils.wordfreqs import WordFreqStore, _atomic_dump
+
+
+def test_top_counts_unmerged_segments(tmp_path):
+    directory = str(tmp_path / "wordfreqs")
+    store = WordFreqStore(directory, flush_interval=3600)
+    store.add({"crawler": 3, "search": 1})
+    store.flush()
+    store.merge()
+    store.add({"search": 5, "index": 2})
+    store.flush()
+    store.add({"index": 2})
+    store.flush()
+
+    # As a report run during the crawl sees it, before the next merge.
+    reader = WordFreqStore(directory)
+    expected = [("search", 6), ("index", 4), ("crawler", 3)]
+    assert reader.top(3) == expected
+    store.close()
+    assert reader.top(3) == expected
+
+
+def test_top_skips_segments_already_merged(tmp_path):
+    directory = str(tmp_path / "wordfreqs")
+    store = WordFreqStore(directory, flush_interval=3600)
+    store.add({"crawler": 3})
+    store.flush()
+    segments = store._segments()
+    # A merge that crashed after saving the base, before deleting.
+    base = store._load_base()
+    base["counts"]["crawler"] = 3
+    base["merged"].update(os.path.basename(segment) for segment in segments)
+    _atomic_dump(base, store.base_path)
+    assert WordFreqStore(directory).top(1) == [("crawler", 3)]
+    store.close()
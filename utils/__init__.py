@@ -1,7 +1,8 @@
 import os
 import logging
+from functools import lru_cache
 from hashlib import sha256
-from urllib.parse import urlparse
+from utils.urls import parse_url, URL_CACHE_SIZE
 
 def get_logger(name, filename=None):
     logger = logging.getLogger(name)
@@ -22,8 +23,9 @@ def get_logger(name, filename=None):
     return logger
 
 
+@lru_cache(maxsize=URL_CACHE_SIZE)
 def get_urlhash(url):
-    parsed = urlparse(url)
+    parsed = parse_url(url)
     # everything other than scheme.
     return sha256(
         f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
@@ -8,12 +8,48 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.engine = config["LOCAL PROPERTIES"].get("ENGINE", "threads")
+        self.max_in_flight = int(
+            config["LOCAL PROPERTIES"].get("MAXINFLIGHT", "256"))
+        self.parser = config["LOCAL PROPERTIES"].get("PARSER", "inline")
+        self.parse_processes = int(
+            config["LOCAL PROPERTIES"].get("PARSEPROCESSES", "0"))
+        self.extractor = config["LOCAL PROPERTIES"].get("EXTRACTOR", "fast")
+        self.shards = int(config["LOCAL PROPERTIES"].get("SHARDS", "1"))
+        self.stats_port = int(
+            config["LOCAL PROPERTIES"].get("STATSPORT", "0"))
+        self.stats_interval = float(
+            config["LOCAL PROPERTIES"].get("STATSINTERVAL", "60"))
+        self.simhash_distance = int(
+            config["CRAWLER"].get("SIMHASHDISTANCE", "3"))
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.frontier = config["LOCAL PROPERTIES"].get("FRONTIER", "polite")
+        self.priority = config["LOCAL PROPERTIES"].get("PRIORITY", "depth")
+        self.store = config["LOCAL PROPERTIES"].get("STORE", "log")
+        self.commit_batch = int(
+            config["LOCAL PROPERTIES"].get("COMMITBATCH", "512"))
+        self.commit_interval = float(
+            config["LOCAL PROPERTIES"].get("COMMITINTERVAL", "200")) / 1000
+        self.bloom_capacity = int(
+            config["LOCAL PROPERTIES"].get("BLOOMCAPACITY", "10000000"))
+        self.bloom_error = float(
+            config["LOCAL PROPERTIES"].get("BLOOMERROR", "0.001"))
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.connect_timeout = float(
+            config["CONNECTION"].get("CONNECTTIMEOUT", "5"))
+        self.read_timeout = float(config["CONNECTION"].get("READTIMEOUT", "30"))
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.max_time_delay = float(
+            config["CRAWLER"].get("MAXPOLITENESS", "60"))
+        self.park_after = int(config["CRAWLER"].get("PARKAFTER", "5"))
+        self.park_time = float(config["CRAWLER"].get("PARKTIME", "300"))
 
-        self.cache_server = None
\ No newline at end of file
+        self.cache_server = None
+        # Set by launch.py --refresh: downloaded urls are queued again.
+        self.refresh = False
+        # Where the crawl stats are written when the crawler stops.
+        self.stats_file = "Logs/metrics.json"
\ No newline at end of file
@@ -0,0 +1,167 @@
+from array import array
+
+
+def split_digest(urlhash):
+    ''' The first 128 bits of a hex url hash as two 64 bit ints. '''
+    hi, lo = int(urlhash[:16], 16), int(urlhash[16:32], 16)
+    # (0, 0) marks an empty slot in a DigestSet.
+    return hi, lo or (0 if hi else 1)
+
+
+def join_digest(hi, lo):
+    ''' The 32 hex digit form of a digest split by split_digest. '''
+    return f"{hi:016x}{lo:016x}"
+
+
+def short_digest(urlhash):
+    ''' The first 64 bits of a hex url hash as an int, never 0. '''
+    return int(urlhash[:16], 16) or 1
+
+
+def _table_size(capacity):
+    size = 16
+    while size * 2 < capacity * 3:
+        size *= 2
+    return size
+
+
+class DigestSet(object):
+    ''' Set of 128 bit url digests, kept as pairs of 64 bit ints in one
+        array with open addressing: 16 bytes a slot, at most two thirds of
+        slots in use, instead of a hex string object per url. Takes and
+        gives hex url hashes; only their first 32 hex digits are kept. '''
+    def __init__(self, capacity=1024):
+        self._allocate(_table_size(capacity))
+
+    def _allocate(self, size):
+        self.mask = size - 1
+        self.slots = array('Q', bytes(16 * size))
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _index(self, hi, lo):
+        ''' The slot holding (hi, lo), or the empty slot where it would go. '''
+        slots = self.slots
+        mask = self.mask
+        index = hi & mask
+        while True:
+            a = slots[2 * index]
+            b = slots[2 * index + 1]
+            if (a == hi and b == lo) or (a == 0 and b == 0):
+                return index
+            index = (index + 1) & mask
+
+    def __contains__(self, urlhash):
+        index = self._index(*split_digest(urlhash))
+        return self.slots[2 * index] != 0 or self.slots[2 * index + 1] != 0
+
+    def add(self, urlhash):
+        ''' Adds urlhash and returns whether it was new. '''
+        hi, lo = split_digest(urlhash)
+        index = self._index(hi, lo)
+        if self.slots[2 * index] or self.slots[2 * index + 1]:
+            return False
+        if 3 * (self.count + 1) > 2 * (self.mask + 1):
+            self._grow()
+            index = self._index(hi, lo)
+        self.slots[2 * index] = hi
+        self.slots[2 * index + 1] = lo
+        self.count += 1
+        return True
+
+    def _grow(self):
+        old = self.slots
+        self._allocate(2 * (self.mask + 1))
+        for i in range(0, len(old), 2):
+            if old[i] or old[i + 1]:
+                index = self._index(old[i], old[i + 1])
+                self.slots[2 * index] = old[i]
+                self.slots[2 * index + 1] = old[i + 1]
+                self.count += 1
+
+    def __iter__(self):
+        slots = self.slots
+        for i in range(0, len(slots), 2):
+            if slots[i] or slots[i + 1]:
+                yield join_digest(slots[i], slots[i + 1])
+
+
+class DigestMap(object):
+    ''' Map from 64 bit url digests (see short_digest) to 64 bit ints, in
+        two arrays with open addressing: 16 bytes a slot, at most two thirds
+        of slots in use. '''
+    def __init__(self, capacity=1024):
+        self._allocate(_table_size(capacity))
+
+    def _allocate(self, size):
+        self.mask = size - 1
+        self.keys = array('Q', bytes(8 * size))
+        self.values = array('Q', bytes(8 * size))
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _index(self, digest):
+        ''' The slot holding digest, or the empty slot where it would go. '''
+        keys = self.keys
+        mask = self.mask
+        index = digest & mask
+        while keys[index] != digest and keys[index] != 0:
+            index = (index + 1) & mask
+        return index
+
+    def get(self, digest):
+        index = self._index(digest)
+        return self.values[index] if self.keys[index] else None
+
+    def put(self, digest, value):
+        index = self._index(digest)
+        if not self.keys[index]:
+            if 3 * (self.count + 1) > 2 * (self.mask + 1):
+                self._grow()
+                index = self._index(digest)
+            self.keys[index] = digest
+            self.count += 1
+        self.values[index] = value
+
+    def _grow(self):
+        old_keys, old_values = self.keys, self.values
+        self._allocate(2 * (self.mask + 1))
+        for digest, value in zip(old_keys, old_values):
+            if digest:
+                index = self._index(digest)
+                self.keys[index] = digest
+                self.values[index] = value
+                self.count += 1
+
+    def items(self):
+        for digest, value in zip(self.keys, self.values):
+            if digest:
+                yield digest, value
+
+    def pop(self, digest):
+        ''' Removes digest and returns its value, or None if it is missing.
+            The entries probed after it are shifted back, so lookups never
+            need tombstones. '''
+        keys, values, mask = self.keys, self.values, self.mask
+        index = self._index(digest)
+        if not keys[index]:
+            return None
+        value = values[index]
+        self.count -= 1
+        hole = index
+        index = (index + 1) & mask
+        while keys[index]:
+            home = keys[index] & mask
+            # Move the entry into the hole unless its home slot lies
+            # cyclically after the hole, up to where it sits now.
+            if (index - home) & mask >= (index - hole) & mask:
+                keys[hole] = keys[index]
+                values[hole] = values[index]
+                hole = index
+            index = (index + 1) & mask
+        keys[hole] = 0
+        return value
@@ -1,25 +1,80 @@
-import requests
-import cbor
 import time
 
 from utils.response import Response
+from utils.metrics import metrics
+
+class Downloader(object):
+    ''' Downloads urls through the cache server over a keep-alive
+        requests.Session, so consecutive downloads reuse the same
+        connection. Each worker holds one for its lifetime. '''
+    def __init__(self, config, logger=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+        host, port = config.cache_server
+        self.cache_url = f"http://{host}:{port}/"
+        self.user_agent = config.user_agent
+        self.timeout = (config.connect_timeout, config.read_timeout)
+        self.logger = logger
+        self.session = requests.Session()
+        # One request at a time to the one cache server: a single pool of a
+        # single connection, kept alive between requests.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("http://", adapter)
+        # Seconds spent on the last request; all of them go to the
+        # "download" histogram.
+        self.last_latency = 0.0
+
+    def download(self, url):
+        import requests
+        start = time.perf_counter()
+        try:
+            resp = self.session.get(
+                self.cache_url,
+                params=[("q", f"{url}"), ("u", f"{self.user_agent}")],
+                timeout=self.timeout)
+        except requests.exceptions.Timeout:
+            return self._error(url, 408, f"Timed out downloading url {url}.")
+        except requests.exceptions.RequestException as e:
+            return self._error(url, 503, f"Request error {e} with url {url}.")
+        finally:
+            self.last_latency = time.perf_counter() - start
+            metrics.histogram("download").record(self.last_latency)
+        return to_response(url, resp.status_code, resp.content, self.logger)
+
+    def _error(self, url, status, error):
+        if self.logger:
+            self.logger.error(error)
+        return Response(
+            {"error": error, "status": status, "url": url},
+            transport_error=True)
+
+    def close(self):
+        self.session.close()
+
 
 def download(url, config, logger=None):
-    host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
-    if resp:
+    downloader = Downloader(config, logger)
+    try:
+        return downloader.download(url)
+    finally:
+        downloader.close()
+
+
+def to_response(url, status_code, content, logger=None):
+    ''' Builds a Response from the cache server's reply to a request for
+        url, given the reply's status code and body. '''
+    if 200 <= status_code < 400:
+        import cbor
         try:
-            return Response(cbor.loads(resp.content))
+            return Response(cbor.loads(content))
         except EOFError:
             logger.error(f"EOFError with url {url}.")
         return Response({
             "error": f"EOFError with url {url}.",
-            "status": resp.status_code,
-            "url": url})
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+            "status": status_code,
+            "url": url}, transport_error=True)
+    logger.error(f"Spacetime Response error <{status_code}> with url {url}.")
     return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
-        "url": url})
+        "error": f"Spacetime Response error <{status_code}> with url {url}.",
+        "status": status_code,
+        "url": url}, transport_error=True)
@@ -0,0 +1,222 @@
+import json
+import time
+
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock, Event
+
+
+class Counter(object):
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Histogram(object):
+    ''' Distribution of durations in seconds, kept as counts in buckets whose
+        upper bounds double from 0.5 ms to about 65 s, plus the exact count,
+        sum and max. Percentiles are reported as bucket upper bounds. '''
+    BOUNDS = [0.0005 * 2 ** i for i in range(18)]
+    __slots__ = ('buckets', 'count', 'total', 'max', 'lock')
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = Lock()
+
+    def record(self, value):
+        index = 0
+        for bound in self.BOUNDS:
+            if value <= bound:
+                break
+            index += 1
+        with self.lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, fraction):
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.BOUNDS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    def merge(self, buckets, count, total, maximum):
+        ''' Adds the values of another histogram to this one. '''
+        with self.lock:
+            for index, bucket in enumerate(buckets):
+                self.buckets[index] += bucket
+            self.count += count
+            self.total += total
+            self.max = max(self.max, maximum)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "count": self.count,
+                "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.percentile(0.5),
+                "p90": self.percentile(0.9),
+                "p99": self.percentile(0.99),
+                "max": self.max}
+
+
+class Registry(object):
+    ''' Crawl-wide metrics, created on first use by name. Counters are
+        also reported as a rate per second since the registry started, and
+        gauges are functions called when a snapshot is taken. '''
+    def __init__(self):
+        self.started = time.time()
+        self.counters = dict()
+        self.histograms = dict()
+        self.gauges = dict()
+        self.lock = Lock()
+
+    def counter(self, name):
+        counter = self.counters.get(name)
+        if counter is None:
+            with self.lock:
+                counter = self.counters.setdefault(name, Counter())
+        return counter
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def gauge(self, name, function):
+        with self.lock:
+            self.gauges[name] = function
+
+    @contextmanager
+    def timer(self, name):
+        ''' Records how long the with block takes in the named histogram. '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name).record(time.perf_counter() - start)
+
+    def snapshot(self):
+        uptime = time.time() - self.started
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = dict(self.histograms)
+            gauges = dict(self.gauges)
+        return {
+            "uptime": uptime,
+            "counters": {
+                name: counter.value for name, counter in sorted(counters.items())},
+            "per_second": {
+                name: counter.value / uptime if uptime else 0.0
+                for name, counter in sorted(counters.items())},
+            "gauges": {name: gauge() for name, gauge in sorted(gauges.items())},
+            "histograms": {
+                name: histogram.snapshot()
+                for name, histogram in sorted(histograms.items())}}
+
+    def export(self):
+        ''' The raw counter and histogram values, for merging into the
+            registry of another process with merge. '''
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = dict(self.histograms)
+        return {
+            "counters": {
+                name: counter.value for name, counter in counters.items()},
+            "histograms": {
+                name: (list(histogram.buckets), histogram.count,
+                       histogram.total, histogram.max)
+                for name, histogram in histograms.items()}}
+
+    def merge(self, exported):
+        ''' Adds values exported from another registry to this one's. '''
+        for name, value in exported["counters"].items():
+            self.counter(name).inc(value)
+        for name, values in exported["histograms"].items():
+            self.histogram(name).merge(*values)
+
+    def dump(self, path):
+        with open(path, "w") as dump:
+            json.dump(self.snapshot(), dump, indent=2)
+
+
+metrics = Registry()
+
+
+class StatsReporter(object):
+    ''' Makes the metrics registry visible while crawling: as json from
+        http://localhost:<port>/ if port is set, and as a one line summary in
+        the log every interval seconds if interval is set. On stop, the full
+        snapshot is written to dump_path. '''
+    def __init__(self, logger, port=0, interval=0, dump_path="Logs/metrics.json"):
+        self.logger = logger
+        self.port = port
+        self.interval = interval
+        self.dump_path = dump_path
+        self.server = None
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        if self.port:
+            self.server = ThreadingHTTPServer(("localhost", self.port), _StatsHandler)
+            Thread(target=self.server.serve_forever, daemon=True).start()
+            self.logger.info(f"Serving crawl stats on http://localhost:{self.port}/")
+        if self.interval:
+            self.thread = Thread(target=self._report_loop, daemon=True)
+            self.thread.start()
+
+    def _report_loop(self):
+        while not self.stopped.wait(self.interval):
+            self.logger.info(summary(metrics.snapshot()))
+
+    def stop(self):
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+        metrics.dump(self.dump_path)
+        self.logger.info(summary(metrics.snapshot()))
+        self.logger.info(f"Wrote crawl stats to {self.dump_path}.")
+
+
+def summary(snapshot):
+    ''' One line overview of a metrics snapshot. '''
+    pages = snapshot["counters"].get("pages", 0)
+    rate = pages / snapshot["uptime"] if snapshot["uptime"] else 0.0
+    parts = [f"{pages} pages", f"{rate:.2f} pages/s"]
+    for name, value in snapshot["gauges"].items():
+        parts.append(f"{name} {value}")
+    for name, histogram in snapshot["histograms"].items():
+        parts.append(
+            f"{name} p50 {histogram['p50'] * 1000:.1f}ms "
+            f"p99 {histogram['p99'] * 1000:.1f}ms")
+    return "Stats: " + ", ".join(parts)
+
+
+class _StatsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(metrics.snapshot(), indent=2).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -1,14 +1,26 @@
 import pickle
 
 class Response(object):
-    def __init__(self, resp_dict):
+    ''' A page downloaded through the cache server. The requests.Response
+        it pickled is only unpickled the first time raw_response is used,
+        so pages skipped on their status alone never pay for it.
+        transport_error is set when the cache server couldn't be reached or
+        sent back no page, so status was made up by the crawler and says
+        nothing about the page's host. '''
+    def __init__(self, resp_dict, transport_error=False):
         self.url = resp_dict["url"]
+        self.transport_error = transport_error
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        self._pickled = resp_dict["response"] if "response" in resp_dict else None
+        self._raw_response = None
+
+    @property
+    def raw_response(self):
+        if self._pickled is not None:
+            try:
+                self._raw_response = pickle.loads(self._pickled)
+            except TypeError:
+                self._raw_response = None
+            self._pickled = None
+        return self._raw_response
\ No newline at end of file
@@ -1,8 +1,9 @@
 import os
-from spacetime import Node
-from utils.pcc_models import Register
+
+from crawler.store import is_shelve
 
 def init(df, user_agent, fresh):
+    from utils.pcc_models import Register
     reg = df.read_one(Register, user_agent)
     if not reg:
         reg = Register(user_agent, fresh)
@@ -19,8 +20,19 @@ def init(df, user_agent, fresh):
             df.push()
     return reg.load_balancer
 
+def has_save_file(config):
+    ''' Whether there is progress to resume: the save file (which may be a
+        shelve kept in several files), or for a sharded crawl the file
+        recording its number of shards. '''
+    if config.shards > 1:
+        return os.path.exists(f"{config.save_file}.shards")
+    return os.path.exists(config.save_file) or is_shelve(config.save_file)
+
 def get_cache_server(config, restart):
+    # spacetime is only needed for registering, so it isn't imported until then.
+    from spacetime import Node
+    from utils.pcc_models import Register
     init_node = Node(
         init, Types=[Register], dataframe=(config.host, config.port))
     return init_node.start(
-        config.user_agent, restart or not os.path.exists(config.save_file))
\ No newline at end of file
+        config.user_agent, restart or not has_save_file(config))
\ No newline at end of file
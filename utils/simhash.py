@@ -0,0 +1,121 @@
+import os
+import struct
+
+from functools import lru_cache
+from hashlib import blake2b
+from threading import Lock
+
+
+@lru_cache(maxsize=1 << 16)
+def _token_hash(token):
+    return blake2b(token.encode('utf-8'), digest_size=8).digest()
+
+
+def simhash(word_counts):
+    ''' Returns the 64 bit SimHash of a page given its word frequencies, with
+        each word weighted by its count. '''
+    # Sum the weights per (byte position, byte value) first, so each word
+    # costs 8 additions instead of 64.
+    tables = [[0] * 256 for _ in range(8)]
+    total = 0
+    for word, count in word_counts.items():
+        for table, byte in zip(tables, _token_hash(word)):
+            table[byte] += count
+        total += count
+    fingerprint = 0
+    for position, table in enumerate(tables):
+        for bit in range(8):
+            mask = 1 << bit
+            weight = sum(table[byte] for byte in range(256) if byte & mask)
+            # Set the bit if the words with it set outweigh those without.
+            if 2 * weight > total:
+                fingerprint |= 1 << (position * 8 + bit)
+    return fingerprint
+
+
+class SimHashIndex(object):
+    ''' Index of 64 bit fingerprints that finds one within max_distance bits
+        of a given fingerprint without comparing against all of them. The
+        fingerprint is split into max_distance + 1 bands; two fingerprints
+        that differ in at most max_distance bits must agree on at least one
+        band, so only fingerprints sharing a band are compared.
+
+        Each fingerprint is indexed with a 64 bit owner, the page's url key,
+        so a page downloaded again (say after a crash lost its links) is not
+        a near-duplicate of itself. Owner 0 is unknown and never skipped.
+
+        Fingerprints are appended to the file at path, after MAGIC, as they
+        are added and loaded back from it on start. '''
+    MAGIC = b'SIMHASH2'
+    RECORD = struct.Struct('<QQ')
+
+    def __init__(self, path, max_distance=3):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        width = 64 // bands
+        # (shift, mask) for each band; the last band takes the leftover bits.
+        self.bands = [
+            (i * width, (1 << (width if i < bands - 1 else 64 - i * width)) - 1)
+            for i in range(bands)]
+        self.tables = [dict() for _ in self.bands]
+        self.lock = Lock()
+        data = b''
+        if os.path.exists(path):
+            with open(path, 'rb') as saved:
+                data = saved.read()
+        if not data.startswith(self.MAGIC):
+            self.file = open(path, 'wb')
+            self.file.write(self.MAGIC)
+            self.file.flush()
+            return
+        data = data[len(self.MAGIC):]
+        usable = len(data) - len(data) % self.RECORD.size
+        for fingerprint, owner in self.RECORD.iter_unpack(data[:usable]):
+            self._add(fingerprint, owner)
+        self.file = open(path, 'ab')
+        if usable < len(data):
+            # A torn write from a crash.
+            self.file.truncate(len(self.MAGIC) + usable)
+
+    @staticmethod
+    def remove(path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _add(self, fingerprint, owner):
+        entry = (fingerprint, owner)
+        for table, (shift, mask) in zip(self.tables, self.bands):
+            table.setdefault((fingerprint >> shift) & mask, []).append(entry)
+
+    def find(self, fingerprint, owner=0):
+        ''' Returns an indexed fingerprint within max_distance bits of
+            fingerprint, or None. Fingerprints of the given owner don't
+            count, unless it is 0. '''
+        for table, (shift, mask) in zip(self.tables, self.bands):
+            for candidate, candidate_owner in table.get(
+                    (fingerprint >> shift) & mask, ()):
+                if owner and candidate_owner == owner:
+                    continue
+                if bin(candidate ^ fingerprint).count('1') <= self.max_distance:
+                    return candidate
+        return None
+
+    def add_if_new(self, fingerprint, owner=0):
+        ''' Adds fingerprint for owner unless a near-duplicate of another
+            owner's is already indexed. Returns whether it was added (or
+            already was, for owner). '''
+        with self.lock:
+            if self.find(fingerprint, owner) is not None:
+                return False
+            shift, mask = self.bands[0]
+            if (fingerprint, owner) in self.tables[0].get(
+                    (fingerprint >> shift) & mask, ()):
+                return True
+            self._add(fingerprint, owner)
+            self.file.write(self.RECORD.pack(fingerprint, owner))
+            self.file.flush()
+            return True
+
+    def close(self):
+        with self.lock:
+            self.file.close()
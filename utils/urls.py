@@ -0,0 +1,50 @@
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import urlparse
+
+# Bound on the number of distinct urls whose parse (and, in scraper.py,
+# is_valid verdict) is remembered.
+URL_CACHE_SIZE = 1 << 16
+
+# A url parsed once: urlparse's fields plus the lowercased host without port.
+ParsedURL = namedtuple(
+    'ParsedURL',
+    ['scheme', 'netloc', 'host', 'path', 'params', 'query', 'fragment'])
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def parse_url(url):
+    ''' Parses url into a ParsedURL. Cached, so the frontier, get_urlhash and
+        is_valid can each look at the same url without parsing it again. '''
+    parsed = urlparse(url)
+    return ParsedURL(
+        parsed.scheme, parsed.netloc, parsed.hostname or '', parsed.path,
+        parsed.params, parsed.query, parsed.fragment)
+
+
+class DomainMatcher(object):
+    ''' Matches hosts against a list of domains by suffix, in one set lookup
+        per label of the host. A domain starting with '.' matches only its
+        subdomains ('.ics.uci.edu' matches 'www.ics.uci.edu'), any other
+        domain matches itself and its subdomains. '''
+    __slots__ = ('exact', 'suffixes')
+
+    def __init__(self, domains):
+        self.exact = dict()
+        self.suffixes = dict()
+        for domain in domains:
+            self.suffixes[domain.lstrip('.')] = domain
+            if not domain.startswith('.'):
+                self.exact[domain] = domain
+
+    def match(self, host):
+        ''' Returns the domain host falls under, or None. '''
+        if host in self.exact:
+            return self.exact[host]
+        dot = host.find('.')
+        while dot != -1:
+            domain = self.suffixes.get(host[dot + 1:])
+            if domain is not None:
+                return domain
+            dot = host.find('.', dot + 1)
+        return None
@@ -0,0 +1,182 @@
+import os
+import glob
+import time
+import heapq
+import atexit
+import pickle
+
+from collections import Counter
+from threading import Thread, Lock, Event
+
+
+class WordFreqStore(object):
+    ''' Word frequencies shared by all workers. Counts are added to an in
+        memory Counter; a background thread writes the accumulated deltas
+        every flush_interval seconds as a new append-only segment file, and
+        folds the segments into the base counts once merge_segments of them
+        have piled up. Each merge also saves the TOP_K most frequent words,
+        so readers can get the top words without loading every count.
+
+        Files in the store directory:
+        -base.pickle: {"counts": {word: count}, "merged": set of segment names}
+        -top.pickle: list of the TOP_K (word, count) pairs, most frequent first
+        -delta-<pid>-<start time>-<seq>.pickle: a {word: count} delta that
+         has not been merged yet '''
+    TOP_K = 1000
+    # A merge lock older than this is left over from a crashed process.
+    STALE_LOCK = 300
+
+    def __init__(self, directory, flush_interval=5.0, merge_segments=16,
+                 legacy_path=None):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.merge_segments = merge_segments
+        # An old single-pickle word count file to start the base from.
+        self.legacy_path = legacy_path
+        self.base_path = os.path.join(directory, "base.pickle")
+        self.top_path = os.path.join(directory, "top.pickle")
+        self.lock_path = os.path.join(directory, "merge.lock")
+        self.deltas = Counter()
+        self.started = int(time.time())
+        self.sequence = 0
+        self.lock = Lock()
+        self.closed = Event()
+        self.flusher = None
+
+    def _start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.flusher = Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def add(self, counts):
+        with self.lock:
+            if self.flusher is None:
+                self._start()
+            self.deltas.update(counts)
+
+    def _flush_loop(self):
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+            if len(self._segments()) >= self.merge_segments:
+                self.merge()
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, "delta-*.pickle")))
+
+    def flush(self):
+        ''' Writes the counts added since the last flush as a new segment. '''
+        with self.lock:
+            deltas, self.deltas = self.deltas, Counter()
+            self.sequence += 1
+            sequence = self.sequence
+        if not deltas:
+            return
+        name = f"delta-{os.getpid()}-{self.started}-{sequence:08d}.pickle"
+        _atomic_dump(dict(deltas), os.path.join(self.directory, name))
+
+    def _load_base(self):
+        if os.path.exists(self.base_path):
+            with open(self.base_path, "rb") as base:
+                return pickle.load(base)
+        counts = dict()
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            with open(self.legacy_path, "rb") as legacy:
+                counts = dict(pickle.load(legacy))
+        return {"counts": counts, "merged": set()}
+
+    def merge(self):
+        ''' Folds every segment into the base counts and refreshes the top
+            words. Segment names are recorded in the base before the
+            segments are deleted, so a merge interrupted by a crash never
+            counts a segment twice. Returns False if another process is
+            already merging. '''
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            lock = os.open(self.lock_path, os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(self.lock_path) > self.STALE_LOCK:
+                    os.remove(self.lock_path)
+            except FileNotFoundError:
+                pass
+            return False
+        try:
+            segments = self._segments()
+            base = self._load_base()
+            counts = base["counts"]
+            # Names of segments that no longer exist can't be merged again.
+            base["merged"].intersection_update(
+                os.path.basename(segment) for segment in segments)
+            for segment in segments:
+                name = os.path.basename(segment)
+                if name in base["merged"]:
+                    continue
+                with open(segment, "rb") as delta:
+                    for word, count in pickle.load(delta).items():
+                        counts[word] = counts.get(word, 0) + count
+                base["merged"].add(name)
+            _atomic_dump(base, self.base_path)
+            _atomic_dump(
+                heapq.nlargest(self.TOP_K, counts.items(), key=lambda x: x[1]),
+                self.top_path)
+            for segment in segments:
+                os.remove(segment)
+        finally:
+            os.close(lock)
+            os.remove(self.lock_path)
+        return True
+
+    def top(self, n, keep=lambda word: True):
+        ''' Returns the n most frequent (word, count) pairs whose word passes
+            keep, as of the last flush. Only reads the saved top words if
+            every segment is merged and enough of them pass keep; otherwise
+            all counts are read and the unmerged segments added to them. '''
+        while True:
+            segments = self._segments()
+            if not segments and os.path.exists(self.top_path):
+                with open(self.top_path, "rb") as top:
+                    words = [item for item in pickle.load(top) if keep(item[0])]
+                if len(words) >= n:
+                    return words[:n]
+            try:
+                counts = self._unmerged_counts(segments)
+            except FileNotFoundError:
+                # Merged and deleted while being read; read again.
+                continue
+            return heapq.nlargest(
+                n, ((word, count) for word, count in counts.items()
+                    if keep(word)),
+                key=lambda x: x[1])
+
+    def _unmerged_counts(self, segments):
+        ''' The base counts with the given segments added, unless the base
+            already has them. Doesn't change the store, so it can be read
+            while a crawl is adding to it. '''
+        base = self._load_base()
+        counts = base["counts"]
+        for segment in segments:
+            if os.path.basename(segment) in base["merged"]:
+                continue
+            with open(segment, "rb") as delta:
+                for word, count in pickle.load(delta).items():
+                    counts[word] = counts.get(word, 0) + count
+        return counts
+
+    def close(self):
+        ''' Stops the background thread and merges everything counted. '''
+        if self.flusher is None or self.closed.is_set():
+            return
+        self.closed.set()
+        self.flusher.join()
+        self.flush()
+        # Wait out a merge running in another process, then fold ours in.
+        while not self.merge():
+            time.sleep(0.1)
+
+
+def _atomic_dump(obj, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as tmp:
+        pickle.dump(obj, tmp, protocol=4)
+    os.replace(tmp_path, path)